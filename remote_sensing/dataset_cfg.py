@@ -3,6 +3,11 @@ cfg = {
     'pol'           : ['HH', 'HV', 'VH', 'VV'],
     'ml_filter'     : 'avg',  # 'avg', 'med'
     'ml_size'       : 2, # 2, 4, 8
+    'ml_workers'    : 1, # threads for the multilook filter (bands and row tiles)
+    'block_rows'    : 0, # 0 loads full stripes, >0 streams row strips of this height (e.g. 2048)
+    'warp_on_demand': 0, # 1 writes a warped .vrt instead of output.tif, tiles are orthorectified when read
+    'warp_memory'   : 1024, # gdal.Warp working buffer in MB
+    'warp_threads'  : 'ALL_CPUS', # gdal.Warp NUM_THREADS, None for single-threaded
     'in_dir'        : '../../dataset/sn6-expanded', # '../../expanded-dataset', # where the SLC stripes located
     # tiling
     'project'       : 'sensor',
@@ -11,13 +16,27 @@ cfg = {
     'out_dir'       : '../../dataset/sensor', # '../../sensor',  # where the tiles will be stored
     'label_dir'     : '../../dataset/spacenet6-challenge/expanded/exp_geojson_buildings', # '../../expanded/geojson_buildings',  
     'load_tile'     : 0,  # 1 means load from tile_scheme folder instead of generating from scratch
+    'vector_format' : 'GeoJSON', # 'GeoJSON' (file per tile) or 'parquet' (file per stripe and split)
+    'tile_manifest' : 1,  # 1 writes the tile manifest (parquet per stripe and split) while tiling, tile lists are read from it
     'verbose'       : 0,  # 1 for all info, 2 for necessary tiling
     # post-tiling
     'tfrec_dir'     : 'tfrecord',   # folder to save tfrecords, change with post-tile versions
     'load_fix'      : 1,            # 1 means load from vector_fix instead of vector
+    'label_engine'  : 'vector',     # 'vector' (per tile vector files), 'direct' (rasterise split labels per tile, no vector tiles)
+                                    #   or 'stripe' (rasterise once per stripe in dataset_gen, slice per tile)
+                                    #   'stripe' snaps tile transforms to the stripe's pixel grid when tiling so the
+                                    #   engines agree (check with lib.tfrec.compare_label_engines), the others keep
+                                    #   the transforms of the tile scheme
     'channel'       : [1,4,3],
+    'norm_mode'     : 'tile',       # 'tile' (hist_clip and min-max per tile) or 'global' (dataset stats from stats_gen.py)
+    'clip_quantiles': [0.01, 0.99], # low and high clip limits of the 'global' norm_mode
     'out_precision' : 8,            # 8, 16 or 32
+    'image_codec'   : 'raw',        # 'raw' (serialized tensor) or 'png' (lossless, out_precision 8 or 16)
+    'label_codec'   : 'raw',        # 'raw' (bool tensor) or 'bits' (bit-packed uint8 tensor)
+    'tfrec_compression': None,      # None, 'GZIP' or 'ZLIB', pass as compression_type to TFRecordDataset
     'tfrec_size'    : 100,          # num examples per tfrec
+    'tile_cache_dir': None,         # dir of the preprocessed tile cache (image and label arrays), None to disable
+    'tile_cache_gb' : 20,           # tile cache size, least recently used tiles are evicted after each split
     'perc_data'     : 1.0,          # percentage of training data
     'rotation'      : 0,
     'flip'          : 0,
@@ -28,11 +47,13 @@ folder structure
 {out_dir}
     {name}
         raster
+        manifest
         {tfrec_dir}
     s0
         tile_scheme
         vector
         vector_fix
+        label_stripe
     s80
         tile_scheme
         vector
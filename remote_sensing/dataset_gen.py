@@ -44,8 +44,9 @@ if os.path.isdir(save_path):
 
 
 from sar_preproc import SarPreproc
-from tile_gen import get_labels_bounds, raster_vector_tiling
-from tile_scheme import load_raster_vector_tiling, load_scheme, parallel_tile_generator
+from tile_gen import get_labels_bounds, raster_vector_tiling, save_label_stripe
+from tile_scheme import load_raster_vector_tiling, load_scheme, parallel_tiling
+from lib.manifest import write_manifest
 # import lib.tfrec as tfrec
 
 def run_parallel_ops(operation, input, pool):
@@ -74,19 +75,25 @@ if __name__=='__main__':
             with timebudget('SAR PRE-PROC'): sar_preproc()
             
             # tile raster and vector
-            proc_slc_path = os.path.join(cfg["out_dir"], out_fn)  # output.tif path
+            proc_slc_path = sar_preproc.out_path  # output.tif (or .vrt) path
             if cfg['load_tile']:
                 print('loading tiles from scheme')
                 # combining schemes
                 schemes = []
+                split_schemes = {}
                 for split in ['train','val','test']:
-                    scheme = load_scheme(cfg, timestamp, orient, split)
-                    for el in scheme:
-                        schemes.append((el, proc_slc_path, save_path))
+                    split_schemes[split] = load_scheme(cfg, timestamp, orient, split)
+                    schemes.extend(split_schemes[split])
                 
                 # print(len(schemes))
-                proc_pool = Pool(8)
-                run_parallel_ops(parallel_tile_generator, schemes, proc_pool)
+                nodata_percs = parallel_tiling(schemes, proc_slc_path, save_path, processes=8,
+                                               snap=cfg['label_engine'] == 'stripe')
+                if cfg['tile_manifest']:
+                    start = 0
+                    for split in ['train','val','test']:
+                        end = start + len(split_schemes[split])
+                        write_manifest(cfg, split_schemes[split], nodata_percs[start:end], labels[split])
+                        start = end
                 # load_raster_vector_tiling(cfg, timestamp, orient, proc_slc_path, save_path)
 
             else:
@@ -95,6 +102,11 @@ if __name__=='__main__':
                     raster_dict, vector_dict = raster_vector_tiling(
                         cfg, labels, bounds, timestamp, orient, proc_slc_path, save_path)
 
+            if cfg['label_engine'] == 'stripe':
+                with timebudget('LABEL STRIPE'):
+                    for split in ['train','val','test']:
+                        save_label_stripe(cfg, timestamp, orient, split, labels[split], proc_slc_path)
+
 # end of code
 
 
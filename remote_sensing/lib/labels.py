@@ -0,0 +1,37 @@
+"""label and tile scheme files shared by the tiling scripts (tile_gen,
+tile_scheme, s_dataset_gen) and lib.tfrec
+"""
+import os
+import pickle
+
+import geopandas as gpd
+
+
+def get_label_gdf(split, in_dir):
+    """split: str. 'train', 'val', 'test'
+    in_dir: str. root path to folder containing .geojson
+    """
+    return gpd.read_file(get_label_path(split, in_dir))
+
+def get_label_path(split, in_dir):
+    """path of a split's building footprint .geojson"""
+    fn = f'SN6_AOI_11_Rotterdam_Buildings_GT20sqm-{split.capitalize()}.geojson'
+    return os.path.join(in_dir, fn)
+
+def get_scheme_path(cfg, timestamp, orient, split):
+    out_path = os.path.join(cfg['out_dir'], f"s{cfg['stride']}", 'tile_scheme')
+    fn = '{}_{}_{}.pickle'.format(timestamp, orient, split)
+    return os.path.join(out_path, fn)
+
+def load_scheme(cfg, timestamp, orient, split):
+    """scheme contains [name, bound, profile] for each filtered tiles (above nodata_threshold)
+    """
+    with open(get_scheme_path(cfg, timestamp, orient, split), 'rb') as f:
+        scheme = pickle.load(f)
+    return scheme
+
+def get_label_stripe_path(cfg, timestamp, orient, split):
+    """[mask_path, grid_path] of a split's label stripe"""
+    out_path = os.path.join(cfg['out_dir'], f"s{cfg['stride']}", 'label_stripe')
+    fn = '{}_{}_{}'.format(timestamp, orient, split)
+    return os.path.join(out_path, fn + '.npy'), os.path.join(out_path, fn + '.pickle')
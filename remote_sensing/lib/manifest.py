@@ -0,0 +1,109 @@
+"""tile manifest: a row per raster tile with its stripe, split, bounds, nodata
+fraction and building count, written by the tilers so tile lists are read from
+a few parquet files (the raster folder is only listed to catch stripes missing
+from them)
+{out_dir}/{name}/manifest/{timestamp}_{orient}_{split}.parquet
+"""
+import os
+import re
+import glob
+
+import numpy as np
+import pandas as pd
+from shapely.geometry import box
+
+# sensor_20190804111224_20190804111453_o1_base_test_s0_0000.tif
+TILE_FN = re.compile(
+    r'(?P<project>[^_]+)_(?P<timestamp>\d+_\d+)_o(?P<orient>[^_]+)_.+'
+    r'_(?P<split>train|val|test)_s(?P<stride>\d+)_(?P<tile_id>\d+)\.tif$')
+
+
+def get_manifest_dir(cfg):
+    return os.path.join(cfg["out_dir"], cfg["name"], 'manifest')
+
+def parse_tile_fn(fn):
+    """fields of a tile filename: project, timestamp, orient, split, stride, tile_id"""
+    return TILE_FN.match(os.path.basename(fn)).groupdict()
+
+def count_buildings(labels, bounds):
+    """number of label geometries intersecting each tile
+    labels : geodataframe in the crs of the bounds
+    bounds : list of [minx, miny, maxx, maxy]
+    """
+    if labels is None:
+        return np.full(len(bounds), -1)
+    tiles = [box(*tb) for tb in bounds]
+    sindex = labels.sindex
+    if hasattr(sindex, 'query_bulk'):
+        tile_idx, _ = sindex.query_bulk(tiles, predicate='intersects')
+    else:
+        tile_idx, _ = sindex.query(tiles, predicate='intersects')
+    return np.bincount(tile_idx, minlength=len(bounds))
+
+def write_manifest(cfg, schemes, nodata_percs, labels=None):
+    """saves the manifest rows of tiles, a part per stripe and split
+    schemes : list
+        [[dest_fname, bound, profile],...] of the saved tiles, as in tile_scheme
+    nodata_percs : list
+        nodata fraction of each tile
+    labels : geodataframe
+        building footprints of the split, None leaves n_buildings at -1
+    """
+    if len(schemes) == 0:
+        return
+    fields = [parse_tile_fn(fn) for fn, _, _ in schemes]
+    bounds = np.array([tb for _, tb, _ in schemes], dtype=np.float64).reshape(-1, 4)
+    df = pd.DataFrame({
+        'fn': [fn for fn, _, _ in schemes],
+        'tile_id': [f['tile_id'] for f in fields],
+        'timestamp': [f['timestamp'] for f in fields],
+        'orient': [f['orient'] for f in fields],
+        'split': [f['split'] for f in fields],
+        'stride': [int(f['stride']) for f in fields],
+        'minx': bounds[:, 0],
+        'miny': bounds[:, 1],
+        'maxx': bounds[:, 2],
+        'maxy': bounds[:, 3],
+        'nodata_perc': np.asarray(nodata_percs, dtype=np.float32),
+        'n_buildings': count_buildings(labels, bounds.tolist()).astype(np.int32),
+    })
+
+    manifest_dir = get_manifest_dir(cfg)
+    if not os.path.isdir(manifest_dir):
+        os.makedirs(manifest_dir)
+    for (timestamp, orient, split), part in df.groupby(['timestamp', 'orient', 'split']):
+        part_fn = '{}_{}_{}.parquet'.format(timestamp, orient, split)
+        part.to_parquet(os.path.join(manifest_dir, part_fn), index=False)
+
+def read_manifest(cfg, split=None, columns=None):
+    """manifest rows of all tiles, or of a split, sorted by fn
+    returns : pd.DataFrame
+    """
+    filters = [('split', '==', split)] if split is not None else None
+    df = pd.read_parquet(get_manifest_dir(cfg), columns=columns, filters=filters)
+    return df.sort_values('fn').reset_index(drop=True) if 'fn' in df else df
+
+def _stripe_of(fn):
+    """(timestamp, orient) of a tile filename, None if it is not one"""
+    m = TILE_FN.match(os.path.basename(fn))
+    return None if m is None else (m['timestamp'], m['orient'])
+
+def list_tile_fns(cfg, split):
+    """sorted raster tile filenames of a split, from the manifest if there
+    is one, else by globbing the raster folder
+    tiles of stripes without manifest rows (tiled before the manifest, or by
+    a partial run) are added from the raster folder, with a notice
+    """
+    path = os.path.join(cfg["out_dir"], cfg["name"], 'raster', f'*{split}*.tif')
+    disk_fns = sorted(os.path.basename(p) for p in glob.glob(path))
+    if not (cfg["tile_manifest"] and os.path.isdir(get_manifest_dir(cfg))):
+        return disk_fns
+    fns = read_manifest(cfg, split, columns=['fn'])['fn'].tolist()
+    stripes = {_stripe_of(fn) for fn in fns}
+    missing = [fn for fn in disk_fns if _stripe_of(fn) not in stripes]
+    if missing:
+        n_stripes = len({_stripe_of(fn) for fn in missing})
+        print(f'{len(missing)} {split} tiles of {n_stripes} stripes are not in the manifest, '
+              'listed from the raster folder')
+        fns = sorted(fns + missing)
+    return fns
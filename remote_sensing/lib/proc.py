@@ -15,60 +15,184 @@ def to_chw(image):
     """
     return np.transpose(image,[2,0,1])
 
-def _norm_plane(plane):
-    """normalization only on 1 plane
-    plane: np.array in format [h,w,c]
+def _plane_axes(plane, cfirst):
+    """axes of height and width, each plane (channel of each image) is
+    scaled on its own
     """
-    plane =  plane - np.nanmin(plane)
-    return plane / np.nanmax(plane)
+    if cfirst or plane.ndim == 2:
+        return (-2, -1)
+    return (-3, -2)
 
-def normalize(plane, cfirst=False):
-    """Scales pixel value to 0.0 - 1.0
-    does not change image shape
-    --------
-    plane: np.array in format [h,w,c]
-    cfirst: bool, use cfirst=1 if image format [c,h,w]
+def _nan_values(plane):
+    """plane as a np.array where masked pixels are nan, for the fast nan
+    reductions of plain arrays
     """
-    if cfirst: plane = to_hwc(plane)
+    if np.ma.isMaskedArray(plane) and np.issubdtype(plane.dtype, np.floating):
+        return np.ma.filled(plane, np.nan)
+    return plane
 
-    # 1ch image usually have only [w,h] or [w,h,1]
-    if len(plane.shape) == 2 or plane.shape[-1] == 1:
-        norm_image = _norm_plane(plane)
-    else:
-        norm_image = np.zeros_like(plane, dtype=np.float32)
-        for i in range(plane.shape[-1]):
-            norm_image[:,:,i] = _norm_plane(plane[:,:,i])
+def _single_plane(plane, cfirst):
+    """1ch image usually have only [h,w] or [h,w,1]"""
+    return plane.ndim == 2 or plane.shape[-3 if cfirst else -1] == 1
+
+def _new_out(plane, out, dtype=None):
+    """out, or a new array for it of dtype (default the float dtype of
+    plane, float64 for int planes)
+    """
+    if out is not None:
+        return out
+    if dtype is None:
+        dtype = plane.dtype if np.issubdtype(plane.dtype, np.floating) else np.float64
+    return np.empty(plane.shape, dtype=dtype)
 
-    # swap back to original ch first
-    if cfirst: norm_image = to_chw(norm_image)
+def _scale(out, scale):
+    """divides out by scale, a constant plane (scale of 0) becomes 0 instead
+    of nan
+    """
+    scale = np.ma.filled(scale, 1)
+    scale[scale == 0] = 1
+    np.divide(out, scale, out=out, casting='unsafe')
+
+def _masked_like(plane, out, masked_vals, keep_mask=True):
+    """restores the masked pixels of plane in out, and returns out as a
+    masked array if plane is one and keep_mask
+    """
+    mask = np.ma.getmask(plane)
+    if mask is np.ma.nomask:
+        return out
+    out[mask] = masked_vals
+    return np.ma.masked_array(out, mask=mask) if keep_mask else out
 
-    return norm_image
+def normalize(plane, cfirst=False, out=None):
+    """Scales pixel value to 0.0 - 1.0
+    does not change image shape
+    --------
+    plane: np.array in format [h,w], [h,w,c] or a batch [n,h,w,c]
+        masked pixels and nan are left out of the min and max
+    cfirst: bool, use cfirst=1 if image format [c,h,w] or [n,c,h,w]
+    out: np.array, optional
+        same shape as plane to write into, can be plane itself
+    returns: np.array
+        masked stays masked, float32 for several channels, else the float
+        dtype of plane (float64 for int)
+    """
+    axes = _plane_axes(plane, cfirst)
+    single = _single_plane(plane, cfirst)
+    values = _nan_values(plane)
+    low = np.nanmin(values, axis=axes, keepdims=True)
+    high = np.nanmax(values, axis=axes, keepdims=True)
+    masked_vals = np.ma.getdata(plane)[np.ma.getmaskarray(plane)]
 
-def _stan_plane(plane):
-    plane = plane - np.mean(plane)
-    return plane / np.std(plane)
+    out = _new_out(plane, out, None if single else np.float32)
+    np.subtract(np.ma.getdata(plane), np.ma.getdata(low), out=out, casting='unsafe')
+    _scale(out, high - low)
+    return _masked_like(plane, out, masked_vals)
 
-def standardize(plane, cfirst=False):
+def standardize(plane, cfirst=False, out=None):
     """Scales pixel value to have mean=0.0 and std=1.0
     does not change image shape
     --------
-    plane: np.array in format [h,w,c]
-    cfirst: bool, use cfirst=1 if image format [c,h,w]
+    plane: np.array in format [h,w], [h,w,c] or a batch [n,h,w,c]
+        masked pixels and nan are left out of the mean and std
+    cfirst: bool, use cfirst=1 if image format [c,h,w] or [n,c,h,w]
+    out: np.array, optional
+        same shape as plane to write into, can be plane itself
+    returns: np.array
+        float64 np.array for several channels, else the type of plane
+        (masked stays masked, float64 for int)
     """
-    if cfirst: plane = to_hwc(plane)
+    axes = _plane_axes(plane, cfirst)
+    single = _single_plane(plane, cfirst)
+    values = _nan_values(plane)
+    mean = np.nanmean(values, axis=axes, keepdims=True)
+    std = np.nanstd(values, axis=axes, keepdims=True)
+    masked_vals = np.ma.getdata(plane)[np.ma.getmaskarray(plane)]
 
-    # 1ch image usually have only [w,h] or [w,h,1]
-    if len(plane.shape) == 2 or plane.shape[-1] == 1:
-        stan_image = _stan_plane(plane)
-    else:
-        stan_image = np.zeros(plane.shape)
-        for i in range(plane.shape[-1]): 
-            stan_image[:,:,i] = _stan_plane(plane[:,:,i])
+    out = _new_out(plane, out, None if single else np.float64)
+    np.subtract(np.ma.getdata(plane), np.ma.getdata(mean), out=out, casting='unsafe')
+    _scale(out, std)
+    return _masked_like(plane, out, masked_vals, keep_mask=single)
+
+_HIST_BLOCK = 2**16  # pixels binned at a time, as np.histogram
 
-    # swap back to original ch first
-    if cfirst: stan_image = to_chw(stan_image)
+def _histograms(images, bins=256):
+    """fixed-bin histogram of each image of a stack, over its valid (unmasked,
+    finite) pixels between its own min and max, same bins as np.histogram
+    min and max of the stack are axis reductions, then the bin index of every
+    pixel (offset by image) is counted with np.bincount, a block of pixels
+    of all images at a time
+    images: np.array of [n, ...]
+    returns: [hists, edges] of [n, bins] and [n, bins+1]
+    """
+    n = len(images)
+    data = _nan_values(images).reshape(n, -1)
+    # masked float pixels are nan (_nan_values), only int masked arrays keep a mask
+    mask = np.ma.getmask(data)
+    data = np.ma.getdata(data)
+    if mask is not np.ma.nomask:
+        info = np.iinfo(data.dtype)
+        low = np.min(data, axis=1, where=~mask, initial=info.max)
+        high = np.max(data, axis=1, where=~mask, initial=info.min)
+    else:
+        low = np.nanmin(data, axis=1)
+        high = np.nanmax(data, axis=1)
+    edges = np.stack([np.histogram_bin_edges(data[:0], bins, range=(lo, hi))
+                      for lo, hi in zip(low, high)])
+    first = edges[:, :1]
+    norm = bins / (edges[:, -1:] - first)
+    # bins+2 slots per image: the bins, the pixels equal to the last edge
+    # (added to the last bin, which is closed as in np.histogram) and the
+    # invalid pixels. the edge past the last one is inf, nothing goes above
+    slots = bins + 2
+    flat_edges = np.concatenate([edges, np.full((n, 1), np.inf)], axis=1).ravel()
+    offset = np.arange(n)[:, None] * slots
+    counts = np.zeros(n * slots, dtype=np.intp)
+    floating = np.issubdtype(data.dtype, np.floating)
+    step = max(1, _HIST_BLOCK // n)
+    for i in range(0, data.shape[1], step):
+        values = data[:, i:i+step]
+        invalid = ~np.isfinite(values) if floating else np.zeros(values.shape, dtype=bool)
+        if mask is not np.ma.nomask:
+            invalid |= mask[:, i:i+step]
+        has_invalid = invalid.any()
+        if has_invalid:
+            values = np.where(invalid, first, values)
+        idx = ((values - first) * norm).astype(np.intp)
+        idx += offset
+        # as np.histogram, a pixel off by one bin from rounding is moved back
+        idx -= values < flat_edges[idx]
+        idx += values >= flat_edges[idx + 1]
+        if has_invalid:
+            np.copyto(idx, offset + bins + 1, where=invalid)
+        counts += np.bincount(idx.ravel(), minlength=n * slots)
+    counts = counts.reshape(n, slots)
+    hists = counts[:, :bins].copy()
+    hists[:, -1] += counts[:, bins]
+    return hists, edges
 
-    return stan_image
+def _hist_limits(hist, bin, thresh):
+    """[low, high] pixel values hist_clip clips an image to, from its
+    histogram (_histograms), computed once over all channels
+    """
+    bins = len(hist)
+    # the former recursion raised thresh by 80 and recomputed the histogram
+    # until the first bin above thresh was within bins/2 of the peak. the first
+    # (last) idx where hist > t is found for every t at once from the running
+    # max of hist from the left (right)
+    left_max = np.maximum.accumulate(hist)
+    right_max = np.maximum.accumulate(hist[::-1])
+    peak = np.argmax(hist)
+    # thresholds the recursion tries, while some bin is still above them
+    threshs = thresh + 80*np.arange(max(hist[peak] - thresh + 79, 0)//80)
+    low_idxs = np.searchsorted(left_max, threshs, side='right')
+    found = np.flatnonzero(peak - low_idxs <= int(bins/2))
+    if len(found) == 0:
+        raise IndexError('no histogram bin above thresh near the peak')
+    thresh = threshs[found[0]]
+    low_idx = low_idxs[found[0]]
+    high_idx = bins - 1 - np.searchsorted(right_max, thresh, side='right')
+    # get low and high pixel values
+    return bin[low_idx], bin[high_idx]
 
 def hist_clip(image, thresh):
     """removes extreme low/high pixel values that are rare (low count)
@@ -80,23 +204,28 @@ def hist_clip(image, thresh):
         be clipped 
         first idx of hist where pixel counts exceeds thresh -> low_idx
         last idx of hist where pixel counts below thresh -> high_idx
+        if the first such idx is more than half the bins below the histogram
+        peak, thresh is raised by 80 until it is not
     returns: clipped image 
     """
-    bins = 256
-    hist, bin = np.histogram(image, bins=bins,
-                             range=(np.nanmin(image),np.nanmax(image)))
-    # returns index where condition is true
-    idx_limit = np.argwhere(hist>thresh)
-    # how far away the lowest hist_idx > thresh is from idx of hist_peak
-    peak = np.argmax(hist)
-    dif = peak-idx_limit[0][0]
-    if dif>int(bins/2):
-        return hist_clip(image, thresh+80)
-    else:
-        low_idx = idx_limit[0][0]
-        high_idx = idx_limit[-1][0]
-        # get low and high pixel values
-        low = bin[low_idx]
-        high = bin[high_idx]
-        # clip based on low and high limit
-        return np.clip(image, a_min=low, a_max=high)
\ No newline at end of file
+    hists, edges = _histograms(image[None])
+    low, high = _hist_limits(hists[0], edges[0], thresh)
+    # clip based on low and high limit
+    return np.clip(image, a_min=low, a_max=high)
+
+def hist_clip_batch(images, thresh):
+    """hist_clip of each image in a stack, the histograms are built in one
+    vectorised call (_histograms) and the stack is clipped in one np.clip call
+    images: np.array
+        [n, ...] stack of images, each gets its own histogram
+    thresh: int
+        see hist_clip
+    returns: clipped images
+    """
+    hists, edges = _histograms(images)
+    # limits search the 256 bins of each histogram
+    limits = np.array([_hist_limits(hist, bin, thresh) for hist, bin in zip(hists, edges)])
+    shape = (len(images),) + (1,)*(images.ndim - 1)
+    return np.clip(images,
+                   a_min=limits[:, 0].reshape(shape),
+                   a_max=limits[:, 1].reshape(shape))
@@ -0,0 +1,190 @@
+"""dataset-wide pixel statistics for the 'global' norm_mode of lib.tfrec.get_image
+rasters (tiles or whole stripes) are read in row strips, the statistics of each
+process are merged, so the tile set is never loaded at once
+"""
+import os
+import json
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+import rasterio as rs
+from rasterio import windows
+
+
+class ChannelStats:
+    """mergeable per-channel statistics of the valid (unmasked, finite) pixels
+    count, mean and m2 (sum of squared deviations) are merged with the
+    pairwise update of Chan et al., the histograms are summed
+    n_ch : int
+    hist_range : np.array or None
+        [n_ch, 2] low and high of the histogram of each channel, values outside
+        are counted in the first or last bin. None leaves out the histograms
+    bins : int
+    """
+    def __init__(self, n_ch, hist_range=None, bins=4096):
+        self.count = np.zeros(n_ch, dtype=np.int64)
+        self.mean = np.zeros(n_ch)
+        self.m2 = np.zeros(n_ch)
+        self.min = np.full(n_ch, np.inf)
+        self.max = np.full(n_ch, -np.inf)
+        self.bins = bins
+        self.hist_range = None if hist_range is None else np.asarray(hist_range, dtype=np.float64)
+        self.hist = None if hist_range is None else np.zeros((n_ch, bins), dtype=np.int64)
+
+    def _merge_moments(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        weight = count / np.maximum(total, 1)
+        self.m2 = self.m2 + m2 + delta**2 * self.count * weight
+        self.mean = self.mean + delta * weight
+        self.count = total
+
+    def update(self, image):
+        """adds the pixels of an image
+        image : np.array
+            [c,h,w], masked pixels and nan are left out
+        """
+        count = np.zeros_like(self.count)
+        mean = np.zeros_like(self.mean)
+        m2 = np.zeros_like(self.m2)
+        for i, plane in enumerate(image):
+            values = np.ma.compressed(plane) if np.ma.isMaskedArray(plane) else plane.ravel()
+            values = values[np.isfinite(values)].astype(np.float64)
+            if len(values) == 0:
+                continue
+            count[i] = len(values)
+            mean[i] = values.mean()
+            m2[i] = np.square(values - mean[i]).sum()
+            self.min[i] = min(self.min[i], values.min())
+            self.max[i] = max(self.max[i], values.max())
+            if self.hist is not None:
+                low, high = self.hist_range[i]
+                np.clip(values, low, high, out=values)
+                self.hist[i] += np.histogram(values, bins=self.bins, range=(low, high))[0]
+        self._merge_moments(count, mean, m2)
+
+    def merge(self, other):
+        """adds the statistics of another ChannelStats with the same histogram bins"""
+        self._merge_moments(other.count, other.mean, other.m2)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        if self.hist is not None:
+            self.hist += other.hist
+        return self
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / np.maximum(self.count, 1))
+
+    def quantile(self, q):
+        """approximate quantile of each channel from the histograms,
+        interpolated within a bin
+        returns : np.array of [n_ch]
+        """
+        cum = np.cumsum(self.hist, axis=1)
+        out = np.empty(len(self.hist))
+        for i, (low, high) in enumerate(self.hist_range):
+            target = q * cum[i, -1]
+            idx = min(np.searchsorted(cum[i], target, side='left'), self.bins - 1)
+            before = cum[i, idx - 1] if idx else 0
+            frac = (target - before) / max(self.hist[i, idx], 1)
+            out[i] = low + (idx + frac) * (high - low) / self.bins
+        return out
+
+
+def raster_stats(path, ch=None, hist_range=None, bins=4096, block_rows=1024):
+    """ChannelStats of a raster, read in row strips of block_rows
+    ch : list
+        band indexes, starts at 1, None for all bands
+    """
+    with rs.open(path) as src:
+        indexes = ch if ch is not None else list(range(1, src.count + 1))
+        stats = ChannelStats(len(indexes), hist_range, bins)
+        for row in range(0, src.height, block_rows):
+            window = windows.Window(0, row, src.width, min(block_rows, src.height - row))
+            stats.update(src.read(indexes=indexes, window=window, masked=True))
+    return stats
+
+def _chunk_stats(paths, **kwargs):
+    stats = None
+    for path in paths:
+        part = raster_stats(path, **kwargs)
+        stats = part if stats is None else stats.merge(part)
+    return stats
+
+def _merged_stats(paths, processes, **kwargs):
+    chunks = [list(c) for c in np.array_split(paths, min(len(paths), processes*4)) if len(c)]
+    stats = None
+    with Pool(processes) as pool:
+        for part in pool.imap(partial(_chunk_stats, **kwargs), chunks):
+            stats = part if stats is None else stats.merge(part)
+    return stats
+
+def collect_stats(paths, ch=None, hist_range=None, bins=4096, processes=4, block_rows=1024):
+    """ChannelStats of a set of rasters (tiles or stripes), computed in parallel
+    paths : list
+        raster paths, processes get contiguous chunks of them
+    hist_range : np.array
+        [n_ch, 2] histogram range per channel. if None, a first pass finds
+        the min and max of each channel and the histograms are filled in a
+        second pass
+    returns : ChannelStats
+    """
+    if len(paths) == 0:
+        raise ValueError('no rasters to collect stats from (no tiles for the split?)')
+    kwargs = dict(ch=ch, bins=bins, block_rows=block_rows)
+    if hist_range is None:
+        first = _merged_stats(paths, processes, **kwargs)
+        hist_range = np.stack([first.min, first.max], axis=1)
+    return _merged_stats(paths, processes, hist_range=hist_range, **kwargs)
+
+
+### STATS FILE ###
+# stats of the 'global' norm_mode, loaded once per process
+_norm_stats = {}
+
+def get_stats_path(cfg):
+    return os.path.join(cfg["out_dir"], cfg["name"], 'stats.json')
+
+def save_stats(stats, path, clip_quantiles=(0.01, 0.99),
+               quantiles=(0.001, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 0.999)):
+    """saves the statistics as json, with the clip limits (low and high) of the
+    global norm_mode at clip_quantiles
+    """
+    out = {
+        'count': stats.count.tolist(),
+        'mean': stats.mean.tolist(),
+        'std': stats.std.tolist(),
+        'min': stats.min.tolist(),
+        'max': stats.max.tolist(),
+        'low': stats.quantile(clip_quantiles[0]).tolist(),
+        'high': stats.quantile(clip_quantiles[1]).tolist(),
+        'clip_quantiles': list(clip_quantiles),
+        'quantiles': {str(q): stats.quantile(q).tolist() for q in quantiles},
+        'hist_range': stats.hist_range.tolist(),
+        'hist': stats.hist.tolist(),
+    }
+    with open(path, 'w') as f:
+        json.dump(out, f)
+
+def load_stats(path):
+    """stats json with low, high and scale (high-low, 1 where constant) as
+    float32 arrays of [c,1,1], ready to broadcast over [c,h,w] images
+    """
+    with open(path) as f:
+        stats = json.load(f)
+    for key in ['low', 'high']:
+        stats[key] = np.array(stats[key], dtype=np.float32)[:, None, None]
+    scale = stats['high'] - stats['low']
+    stats['scale'] = np.where(scale > 0, scale, np.float32(1))
+    return stats
+
+def get_norm_stats(cfg):
+    """stats of the global norm_mode, None for per tile normalisation"""
+    if cfg["norm_mode"] != 'global':
+        return None
+    path = get_stats_path(cfg)
+    if path not in _norm_stats:
+        _norm_stats[path] = load_stats(path)
+    return _norm_stats[path]
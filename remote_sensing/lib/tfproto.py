@@ -0,0 +1,255 @@
+"""TFRecord encoding without TensorFlow
+serialize_tensor gives the same bytes as tf.io.serialize_tensor (a TensorProto),
+encode_example a tf.train.Example of bytes features and TFRecordWriter the
+framing of tf.io.TFRecordWriter, so the files read back with tf.data as before
+encode_png and pack_mask are the compact codecs, decoded by lib.tfrec.read_tfrecord
+"""
+import gzip
+import struct
+import zlib
+
+import numpy as np
+
+# optional dependency (pip install crc32c, listed in environment.yml): a C
+# CRC-32C for the record checksums. without it, crc32c() below runs the
+# numpy lane implementation, same checksums but slower on large records
+try:
+    import crc32c as _crc32c
+except ImportError:
+    _crc32c = None
+
+
+### PROTOBUF WIRE FORMAT ###
+# tensorflow/core/framework/types.proto
+_TF_DTYPES = {
+    np.dtype(np.float32) : 1,   # DT_FLOAT
+    np.dtype(np.float64) : 2,   # DT_DOUBLE
+    np.dtype(np.int32)   : 3,   # DT_INT32
+    np.dtype(np.uint8)   : 4,   # DT_UINT8
+    np.dtype(np.int16)   : 5,   # DT_INT16
+    np.dtype(np.int8)    : 6,   # DT_INT8
+    np.dtype(np.int64)   : 9,   # DT_INT64
+    np.dtype(np.bool_)   : 10,  # DT_BOOL
+    np.dtype(np.uint16)  : 17,  # DT_UINT16
+    np.dtype(np.float16) : 19,  # DT_HALF
+    np.dtype(np.uint32)  : 22,  # DT_UINT32
+    np.dtype(np.uint64)  : 23,  # DT_UINT64
+}
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _varint_field(field, value):
+    return _varint(field << 3) + _varint(value)
+
+def _bytes_field(field, value):
+    return _varint(field << 3 | 2) + _varint(len(value)) + value
+
+def serialize_tensor(array):
+    """TensorProto of a numeric np.array, same bytes as
+        tf.io.serialize_tensor(tf.constant(array)).numpy()
+    returns : bytes
+    """
+    array = np.asarray(array)
+    dtype = _TF_DTYPES[array.dtype]
+    # TensorShapeProto, a dim message per axis (size is left out when 0)
+    shape = b''.join(
+        _bytes_field(2, _varint_field(1, size) if size else b'')
+        for size in array.shape)
+    content = array.astype(array.dtype.newbyteorder('<'), copy=False).tobytes()
+
+    proto = _varint_field(1, dtype) + _bytes_field(2, shape)
+    if content:
+        proto += _bytes_field(4, content)  # tensor_content
+    return proto
+
+def encode_example(features):
+    """tf.train.Example of bytes features
+    features : dict
+        {name: bytes}, each a single value BytesList
+    returns : bytes
+    """
+    entries = b''
+    for name, value in features.items():
+        feature = _bytes_field(1, _bytes_field(1, value))  # bytes_list.value
+        entry = _bytes_field(1, name.encode()) + _bytes_field(2, feature)
+        entries += _bytes_field(1, entry)  # Features.feature map entry
+    return _bytes_field(1, entries)  # Example.features
+
+
+### CODECS ###
+# PNG color type by number of channels
+_PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}  # gray, gray+alpha, RGB, RGBA
+
+def _png_chunk(kind, data):
+    return (struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+def encode_png(image, level=6):
+    """lossless PNG of a uint8 or uint16 image, for tf.io.decode_png
+    image : np.array
+        [h,w] or [h,w,c] with 1 to 4 channels
+    level : int
+        zlib compression level
+    returns : bytes
+    """
+    image = np.asarray(image)
+    if image.ndim == 2:
+        image = image[..., None]
+    h, w, c = image.shape
+    if image.dtype not in (np.uint8, np.uint16) or c not in _PNG_COLOR_TYPES:
+        raise ValueError('PNG needs a uint8 or uint16 image with 1 to 4 channels.')
+    depth = image.dtype.itemsize * 8
+    bpp = c * image.dtype.itemsize  # bytes per pixel
+    # big-endian rows, contiguous so the bytes can be viewed (to_hwc gives a
+    # transposed view)
+    rows = np.ascontiguousarray(image.astype(image.dtype.newbyteorder('>'), copy=False))
+    rows = rows.view(np.uint8).reshape(h, w*bpp)
+    # sub filter, each byte minus the same byte of the previous pixel
+    filtered = np.empty((h, w*bpp + 1), dtype=np.uint8)
+    filtered[:, 0] = 1
+    filtered[:, 1:bpp+1] = rows[:, :bpp]
+    np.subtract(rows[:, bpp:], rows[:, :-bpp], out=filtered[:, bpp+1:])
+
+    header = struct.pack('>IIBBBBB', w, h, depth, _PNG_COLOR_TYPES[c], 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', header)
+            + _png_chunk(b'IDAT', zlib.compress(filtered.tobytes(), level))
+            + _png_chunk(b'IEND', b''))
+
+def pack_mask(mask):
+    """binary mask bit-packed along rows, as a uint8 TensorProto of
+    [h, w/8] (a byte per 8 pixels instead of per pixel)
+    returns : bytes
+    """
+    mask = np.asarray(mask, dtype=bool)
+    if mask.shape[-1] % 8:
+        raise ValueError('Bit-packed masks need a width that is a multiple of 8.')
+    return serialize_tensor(np.packbits(mask, axis=-1))
+
+
+### CRC32C ###
+_CRC_POLY = 0x82f63b78  # Castagnoli, reflected
+_LANE = 256  # bytes per lane of the numpy crc
+
+def _make_crc_table():
+    table = np.arange(256, dtype=np.uint32)
+    for _ in range(8):
+        table = np.where(table & 1, (table >> 1) ^ _CRC_POLY, table >> 1).astype(np.uint32)
+    return table
+
+_CRC_TABLE = _make_crc_table()
+_CRC_LIST = _CRC_TABLE.tolist()
+# [4, 256] byte tables of the zero-byte shifts, by number of lanes shifted
+_shift_tables = {}
+
+def _crc_update(crc, data):
+    table = _CRC_LIST
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xff] ^ (crc >> 8)
+    return crc
+
+def _shift_table(lanes):
+    """tables applying lanes*_LANE zero bytes to a crc register, which is
+    linear, as the xor of the images of the register bytes"""
+    if lanes not in _shift_tables:
+        if lanes == 1:
+            basis = np.left_shift(np.uint32(1), np.arange(32, dtype=np.uint32))
+            for _ in range(_LANE):
+                basis = _CRC_TABLE[basis & 0xff] ^ (basis >> 8)
+        else:
+            half = _shift_table(lanes // 2)
+            basis = np.left_shift(np.uint32(1), np.arange(32, dtype=np.uint32))
+            basis = _apply_shift(_apply_shift(basis, half), half)
+        bits = (np.arange(256)[:, None] >> np.arange(8)) & 1  # [256, 8]
+        tables = np.zeros((4, 256), dtype=np.uint32)
+        for b in range(4):
+            tables[b] = np.bitwise_xor.reduce(
+                np.where(bits, basis[8*b:8*b + 8], np.uint32(0)), axis=1)
+        _shift_tables[lanes] = tables
+    return _shift_tables[lanes]
+
+def _apply_shift(crc, tables):
+    return (tables[0][crc & 0xff] ^ tables[1][(crc >> 8) & 0xff]
+            ^ tables[2][(crc >> 16) & 0xff] ^ tables[3][crc >> 24])
+
+def crc32c(data):
+    """CRC-32C of bytes. uses the crc32c package if installed, else
+    runs the table crc on _LANE byte lanes side by side in numpy and
+    combines the lanes pairwise"""
+    if _crc32c is not None:
+        return _crc32c.crc32c(data)
+    n_lanes = len(data) // _LANE
+    if n_lanes < 16:
+        return _crc_update(0xffffffff, data) ^ 0xffffffff
+
+    lanes = np.frombuffer(data, dtype=np.uint8, count=n_lanes*_LANE).reshape(n_lanes, _LANE)
+    crc = np.zeros(n_lanes, dtype=np.uint32)
+    crc[0] = 0xffffffff
+    for j in range(_LANE):
+        crc = _CRC_TABLE[(crc ^ lanes[:, j]) & 0xff] ^ (crc >> 8)
+    # crc of lanes a then b = crc of a shifted by len(b) zero bytes ^ crc of b
+    width = 1
+    while len(crc) > 1:
+        if len(crc) % 2:
+            crc = np.concatenate([[np.uint32(0)], crc])  # a leading empty lane
+        crc = _apply_shift(crc[0::2], _shift_table(width)) ^ crc[1::2]
+        width *= 2
+    crc = _crc_update(int(crc[0]), data[n_lanes*_LANE:])
+    return crc ^ 0xffffffff
+
+def masked_crc32c(data):
+    """crc of the TFRecord format"""
+    crc = crc32c(data)
+    return (((crc >> 15) | (crc << 17)) + 0xa282ead8) & 0xffffffff
+
+
+### TFRECORD ###
+class _ZlibFile:
+    """write-only zlib stream, the 'ZLIB' compression of tf.data"""
+    def __init__(self, path, level):
+        self.file = open(path, 'wb')
+        self.compressor = zlib.compressobj(level)
+
+    def write(self, data):
+        self.file.write(self.compressor.compress(data))
+
+    def close(self):
+        self.file.write(self.compressor.flush())
+        self.file.close()
+
+class TFRecordWriter:
+    """writes records like tf.io.TFRecordWriter:
+    uint64 length, uint32 masked crc of length, data, uint32 masked crc of data
+    compression : str
+        None, 'GZIP' or 'ZLIB', read with
+        tf.data.TFRecordDataset(..., compression_type=compression)
+    """
+    def __init__(self, path, compression=None, level=6):
+        if not compression:
+            self.file = open(path, 'wb')
+        elif compression == 'GZIP':
+            self.file = gzip.open(path, 'wb', compresslevel=level)
+        elif compression == 'ZLIB':
+            self.file = _ZlibFile(path, level)
+        else:
+            raise ValueError(f'Unknown TFRecord compression {compression}.')
+
+    def write(self, record):
+        header = struct.pack('<Q', len(record))
+        self.file.write(header + struct.pack('<I', masked_crc32c(header)))
+        self.file.write(record)
+        self.file.write(struct.pack('<I', masked_crc32c(record)))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,15 +1,29 @@
 import os
-import glob
-import numpy as np
+import re
+import pickle
+import queue
 import random
+import threading
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+import numpy as np
 import geopandas as gpd
-import tensorflow as tf
 import rasterio as rs
 from rasterio import features as feat
+from rasterio import windows
+from shapely.geometry import box
 
 from solaris.vector_mask import mask_to_poly_geojson
+from solaris.vector_tile import read_vector_tile, split_tile_path
 from solaris.core import save_empty_geojson
+from .labels import (get_label_gdf, get_label_path, get_label_stripe_path,
+                     get_scheme_path, load_scheme)
+from .manifest import list_tile_fns
 from .proc import hist_clip, to_hwc, normalize
+from .stats import get_norm_stats, get_stats_path
+from .tile_cache import TileCache
+from .tfproto import serialize_tensor, encode_example, encode_png, pack_mask, TFRecordWriter
 
 
 def get_tile_paths(cfg, split, shuffle=False):
@@ -23,11 +37,13 @@ def get_tile_paths(cfg, split, shuffle=False):
     perc_data : float [0,1]
         only applies to train split, percentage of examples to be loaded
     returns : [raster_paths, vector_paths]
-        list of all raster paths and vector paths for given split
+        list of all raster paths and vector paths for given split, from the
+        tile manifest if there is one (see lib.manifest)
+        with cfg["vector_format"]=='parquet', vector paths are
+        {stripe}.parquet/{tile_id} (vector_fix is still GeoJSON)
     """
-    path = os.path.join(cfg["out_dir"], cfg["name"], 'raster', f'*{split}*.tif')
-    raster_paths = glob.glob(path)
-    raster_paths.sort()
+    raster_dir = os.path.join(cfg["out_dir"], cfg["name"], 'raster')
+    raster_paths = [os.path.join(raster_dir, fn) for fn in list_tile_fns(cfg, split)]
 
     if shuffle:
         random.Random(17).shuffle(raster_paths)
@@ -42,52 +58,67 @@ def get_tile_paths(cfg, split, shuffle=False):
         vp = rp.replace('raster', vect_str)
         vp = vp.replace('tif','geojson')
         vp = vp.replace(cfg["name"], f's{cfg["stride"]}', 1)
+        if cfg["vector_format"] == 'parquet' and not cfg["load_fix"]:
+            # all tiles of a stripe and split are in one GeoParquet
+            tile_id = os.path.basename(vp).rsplit('.', 1)[0]
+            vp = os.path.join(vp.rsplit('_', 1)[0] + '.parquet', tile_id)
         vector_paths.append(vp)
 
     return raster_paths, vector_paths
 
 
 ### PROC IMAGE ###
-def get_image(raster_path, ch=None, thresh=80):
+def get_image(raster_path, ch=None, thresh=80, stats=None):
     """
     ch = list or int
         starts at 1, if None, return all channels
+    stats : dict
+        from lib.stats.load_stats, for the 'global' norm_mode: clips to the
+        dataset-wide low and high of each channel and scales with them,
+        instead of hist_clip and min-max of the tile
     returns: np.array
         type same as raster (float32), range [0,1]
     """
     raster = rs.open(raster_path)
     image = raster.read(indexes=ch, masked=True)
-    image = hist_clip(image, thresh=thresh)
-    image = to_hwc(image)
-    image = normalize(image)
+    if stats is None:
+        image = hist_clip(image, thresh=thresh)
+        image = to_hwc(image)
+        image = normalize(image)
+    else:
+        image = np.clip(image, stats['low'], stats['high'])
+        image = to_hwc((image - stats['low']) / stats['scale'])
     raster.close()  # close the opened dataset
     return image
 
-def serialize_image(image, out_precision=32):
+def serialize_image(image, out_precision=32, codec='raw'):
     """
     image : np.array
         image with pixel range 0-1
     out_precision : int
         8, 16 or 32 for np.uint8, np.uint16 or np.float32
         for float32, nan will be replaced by 0.0
-        for uint, casting auto converts nan to 0.0
+        for uint, nan is cast to 0 (as tf.cast did)
+    codec : str
+        'raw' serialized TensorProto, same as tf.io.serialize_tensor
+        'png' lossless PNG, only for 8 or 16 precision and 1-4 channels
+    returns : bytes
     """
     if out_precision==8:
-        dtype = tf.uint8
-        image = tf.cast(image*(2**8 - 1), dtype=dtype)
+        dtype = np.uint8
+        image = np.nan_to_num(np.asarray(image*(2**8 - 1)), nan=0.0)
     elif out_precision==16:
-        dtype = tf.uint16
-        image = tf.cast(image*(2**16 - 1), dtype=dtype)
-        # dtype = tf.bfloat16
-        # image = tf.cast(np.nan_to_num(image, nan=0.0), dtype=dtype)
-
+        dtype = np.uint16
+        image = np.nan_to_num(np.asarray(image*(2**16 - 1)), nan=0.0)
     else:
-        dtype = tf.float32
-        image = tf.cast(np.nan_to_num(image, nan=0.0), dtype=dtype)
+        dtype = np.float32
+        image = np.asarray(np.nan_to_num(image, nan=0.0))
 
-    image_tensor = tf.constant(image, dtype=dtype)
-    image_serial = tf.io.serialize_tensor(image_tensor)
-    return image_serial
+    if codec == 'png':
+        if dtype == np.float32:
+            raise ValueError('png codec needs out_precision 8 or 16')
+        return encode_png(image.astype(dtype))
+    return serialize_tensor(image.astype(dtype))
 
 
 ### PROC LABEL ###
@@ -106,9 +137,12 @@ def clip_vector_mask(raster_path, vector_path):
     )
 
     # read vector and clip it
-    vector = gpd.read_file(vector_path)
+    vector = read_vector_tile(vector_path)
     vector_fix = vector.clip(mask_gdf)
 
+    parquet_path, tile_id = split_tile_path(vector_path)
+    if tile_id is not None:  # fixed tiles are saved as GeoJSON
+        vector_path = os.path.join(os.path.dirname(parquet_path), f'{tile_id}.geojson')
     save_fn = vector_path.replace('vector', 'vector_fix')
     if vector_fix.shape[0] == 0:
         save_empty_geojson(save_fn, crs=raster.crs)
@@ -153,30 +187,129 @@ def get_label(raster_path, vector_path, load_fix=0):
         bin_mask is type bool, vector is type geodataframe
     """
     if load_fix:
-        vector_fix = gpd.read_file(vector_path)
+        vector_fix = read_vector_tile(vector_path)
     else:
         vector_fix = clip_vector_mask(raster_path, vector_path)
 
     bin_mask = get_vector_bin(raster_path, vector_fix)
     return bin_mask, vector_fix
 
-def serialize_label(label):
-    """
-    label : np.array
-        binary mask
+# split labels of the label_engine='direct', loaded once per process
+_split_labels = {}
+
+def get_split_labels(cfg, split):
+    """stripe-wide building gdf of a split, with its spatial index built"""
+    key = (cfg["label_dir"], split)
+    if key not in _split_labels:
+        labels = get_label_gdf(split, cfg["label_dir"])
+        labels.sindex  # build the spatial index once
+        _split_labels[key] = labels
+    return _split_labels[key]
+
+def get_label_direct(raster_path, labels):
+    """rasterises the split labels straight into the tile's pixel grid
+        and ANDs it with the tile's valid-data mask. gives the same mask as
+        get_label without polygonising the mask, clipping or vector files
+    raster_path : str
+        path to .tif tile, only opened once for its transform and mask
+    labels : geopandas gdf
+        buildings of the tile's split, in the tile crs (get_split_labels)
+    returns : [bin_mask, vector]
+        bin_mask is type bool, vector is the (unclipped) buildings
+        touching the tile
     """
-    label_tensor = tf.constant(label, dtype=tf.bool)
-    label_serial = tf.io.serialize_tensor(label_tensor)
-    return label_serial
+    raster = rs.open(raster_path)
+    h = raster.height  # rows
+    w = raster.width   # cols
+    transform = raster.transform
+    valid = raster.read_masks(1) > 0
+    bounds = box(*raster.bounds)
+    raster.close()  # close the opened dataset
 
+    vector = labels.iloc[np.sort(labels.sindex.query(bounds, predicate='intersects'))]
+    if vector.shape[0]==0:
+        mask = np.zeros((h,w),dtype=bool)
+    else:
+        mask = feat.geometry_mask(
+            vector.geometry,
+            out_shape=(h,w),
+            transform=transform,
+            invert=True  # pixel buildings == 1
+        )
+        mask &= valid
 
+    return mask, vector
 
-### TFRecord DATA TYPE ###
-def _bytes_feature(value):
-    """Returns a bytes_list from a string / byte."""
-    if isinstance(value, type(tf.constant(0))):
-        value = value.numpy() # BytesList won't unpack a string from an EagerTensor. intended for the image data
-    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+# label stripes of the label_engine='stripe', {(timestamp, orient, split): [mask, grid, windows]}
+_label_stripes = {}
+
+def get_stripe_key(raster_path, cfg):
+    """(timestamp, orient, split) of the stripe a tile was cut from"""
+    tile_fn = os.path.basename(raster_path)
+    m = re.match(rf'{cfg["project"]}_(.+)_o(.+)_{cfg["name"]}_(train|val|test)_s', tile_fn)
+    return m.groups()
+
+def get_label_source_paths(raster_path, cfg, split):
+    """files the label of a tile is made from, besides its vector tile:
+        the split's geojson for label_engine 'direct', the label stripe
+        (mask and grid) and tile scheme of the tile's stripe for 'stripe'
+    """
+    if cfg["label_engine"] == 'direct':
+        return [get_label_path(split, cfg["label_dir"])]
+    if cfg["label_engine"] == 'stripe':
+        key = get_stripe_key(raster_path, cfg)
+        return [*get_label_stripe_path(cfg, *key), get_scheme_path(cfg, *key)]
+    return []
+
+def get_label_stripe(raster_path, cfg):
+    """slices the tile label out of its split's label stripe
+        (tile_gen.save_label_stripe), in the window the tile was read with
+        (tile_scheme.write_tile). no vector or raster file is opened per tile
+    returns : [bin_mask, None]
+        bin_mask is type bool
+    """
+    tile_fn = os.path.basename(raster_path)
+    key = get_stripe_key(raster_path, cfg)
+    if key not in _label_stripes:
+        mask_path, grid_path = get_label_stripe_path(cfg, *key)
+        with open(grid_path, 'rb') as f:
+            grid = pickle.load(f)
+        scheme = load_scheme(cfg, *key)
+        tile_windows = {}
+        for dest_fname, tb, profile in scheme:
+            tile_windows[dest_fname] = windows.from_bounds(
+                *tb, transform=grid['transform'],
+                width=profile['width'], height=profile['height'])
+        _label_stripes[key] = [np.load(mask_path, mmap_mode='r'), grid, tile_windows]
+    packed, grid, tile_windows = _label_stripes[key]
+
+    # offsets rounded like rasterio window reads
+    window = tile_windows[tile_fn]
+    row0 = int(np.floor(window.row_off + .5))
+    col0 = int(np.floor(window.col_off + .5))
+    h = int(np.floor(window.height + .5))
+    w = int(np.floor(window.width + .5))
+    # part of the window inside the stripe, the rest stays False
+    r0, r1 = max(row0, 0), min(row0 + h, grid['shape'][0])
+    c0, c1 = max(col0, 0), min(col0 + w, grid['shape'][1])
+    mask = np.zeros((h, w), dtype=bool)
+    if r0 < r1 and c0 < c1:
+        bits = np.unpackbits(packed[r0:r1, c0//8:(c1 + 7)//8], axis=1)
+        mask[r0-row0:r1-row0, c0-col0:c1-col0] = bits[:, c0 % 8:c0 % 8 + c1 - c0]
+    return mask, None
+
+def serialize_label(label, codec='raw'):
+    """
+    label : np.array
+        binary mask
+    codec : str
+        'raw' serialized bool TensorProto, same as tf.io.serialize_tensor
+        'bits' uint8 TensorProto of the mask bit-packed along rows (1/8 the size)
+    returns : bytes
+    """
+    if codec == 'bits':
+        return pack_mask(label)
+    return serialize_tensor(np.asarray(label, dtype=bool))
 
 
 
@@ -198,30 +331,117 @@ def create_tfrecord(raster_paths, vector_paths, cfg, base_fn, size):
         size2 = min(size, tot_ex - i*size)  # size=size2 unless for remaining in last file
         fn = f'{base_fn}{i:02}-{size2}.tfrec'
 
-        with tf.io.TFRecordWriter(fn) as writer:
+        with TFRecordWriter(fn, cfg['tfrec_compression']) as writer:
             for j in range(size2):
                 idx = i*size+j  # ith tfrec * num_img per tfrec as the start of this iteration
-                image = get_image(raster_paths[idx], cfg['channel'])
-                image_serial = serialize_image(image, cfg['out_precision'])
+                image = get_image(raster_paths[idx], cfg['channel'], stats=get_norm_stats(cfg))
+                image_serial = serialize_image(image, cfg['out_precision'], cfg['image_codec'])
 
                 label, label_gdf = get_label(raster_paths[idx], vector_paths[idx])
-                label_serial = serialize_label(label)
+                label_serial = serialize_label(label, cfg['label_codec'])
 
                 fn = os.path.basename(raster_paths[idx]).split('.')[0]
 
                 feature = {
-                    'image': _bytes_feature(image_serial.numpy()),
-                    'label': _bytes_feature(label_serial.numpy()),
-                    'fn' : _bytes_feature(tf.compat.as_bytes(fn))
+                    'image': image_serial,
+                    'label': label_serial,
+                    'fn' : fn.encode()
                 }
 
                 # write tfrecords
-                example = tf.train.Example(features=tf.train.Features(feature=feature))
-                writer.write(example.SerializeToString())
+                writer.write(encode_example(feature))
                 
                 if j%50==0:
                     print(f'{j} / {size2}')
 
+# tile cache of the process, None when cfg["tile_cache_dir"] is not set
+_tile_caches = {}
+
+def get_tile_cache(cfg):
+    """TileCache of cfg["tile_cache_dir"], one per process"""
+    if not cfg["tile_cache_dir"]:
+        return None
+    if cfg["tile_cache_dir"] not in _tile_caches:
+        _tile_caches[cfg["tile_cache_dir"]] = TileCache(
+            cfg["tile_cache_dir"], int(cfg["tile_cache_gb"] * 2**30))
+    return _tile_caches[cfg["tile_cache_dir"]]
+
+def get_tile_label(raster_path, vector_path, cfg, split):
+    """label mask of a tile from cfg["label_engine"]
+    returns : np.array type: bool
+    """
+    if cfg["label_engine"] == 'direct':
+        label, _ = get_label_direct(raster_path, get_split_labels(cfg, split))
+    elif cfg["label_engine"] == 'stripe':
+        label, _ = get_label_stripe(raster_path, cfg)
+    else:
+        label, _ = get_label(raster_path, vector_path, cfg["load_fix"])
+    return label
+
+def compare_label_engines(cfg, split, engines=('vector', 'direct', 'stripe'), max_tiles=None):
+    """labels of the tiles of a split from each label engine, compared with
+        those of engines[0]. they agree when the tiles lie on the grid of
+        their stripe (tiled with label_engine 'stripe', which snaps them),
+        with tiles off the grid every label is shifted by the sub-pixel offset
+        each engine needs its files: vector tiles (vector_fix if
+        cfg["load_fix"]), the split geojson for 'direct', the label stripes
+        and tile schemes for 'stripe'
+    max_tiles : int
+        compares the first max_tiles tiles of the split, None for all
+    returns : {engine: [fns of the tiles whose label differs from engines[0]]}
+    """
+    raster_paths, vector_paths = get_tile_paths(cfg, split)
+    n = len(raster_paths) if max_tiles is None else max_tiles
+    diffs = {engine: [] for engine in engines[1:]}
+    for raster_path, vector_path in zip(raster_paths[:n], vector_paths[:n]):
+        labels = [get_tile_label(raster_path, vector_path, dict(cfg, label_engine=engine), split)
+                  for engine in engines]
+        for engine, label in zip(engines[1:], labels[1:]):
+            if not np.array_equal(label, labels[0]):
+                diffs[engine].append(os.path.basename(raster_path))
+    for engine in engines[1:]:
+        print(f'{engines[0]} vs {engine}: {len(diffs[engine])} of {min(n, len(raster_paths))} tiles differ')
+    return diffs
+
+def get_image_label(raster_path, vector_path, cfg, split):
+    """normalised image and label mask of a tile, read from the tile cache
+    (and added to it on a miss) if cfg["tile_cache_dir"] is set
+    returns : [image, label]
+    """
+    cache = get_tile_cache(cfg)
+    if cache is not None:
+        extra_paths = [get_stats_path(cfg)] if cfg["norm_mode"] == 'global' else []
+        extra_paths += get_label_source_paths(raster_path, cfg, split)
+        key = cache.key(raster_path, vector_path, cfg, extra_paths)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    image = get_image(raster_path, cfg["channel"], stats=get_norm_stats(cfg))
+    label = get_tile_label(raster_path, vector_path, cfg, split)
+
+    if cache is not None:
+        cache.put(key, image, label)
+    return image, label
+
+def serialize_example(raster_path, vector_path, cfg, split):
+    """image, label and fn of one tile as a serialized tf.train.Example
+    returns : bytes
+    """
+    image, label = get_image_label(raster_path, vector_path, cfg, split)
+    image_serial = serialize_image(image, cfg["out_precision"], cfg["image_codec"])
+    label_serial = serialize_label(label, cfg["label_codec"])
+
+    fn = os.path.basename(raster_path).split('.')[0]
+
+    feature = {
+        'image': image_serial,
+        'label': label_serial,
+        'fn' : fn.encode()
+    }
+
+    return encode_example(feature)
+
 def create_tfrecord_parallel(proc_idx, base_fn, split, cfg):
     
     """divides task between process based on num of tfrecords of a given split
@@ -235,34 +455,124 @@ def create_tfrecord_parallel(proc_idx, base_fn, split, cfg):
     print(f'Writing TFRecord {proc_idx} of {tot_tf}..')
     size2 = min(size, tot_ex - proc_idx*size)  # size=size2 unless for remaining in last file
     fn = f'{base_fn}{proc_idx:02}-{size2}.tfrec'
-    with tf.io.TFRecordWriter(fn) as writer:
+    with TFRecordWriter(fn, cfg["tfrec_compression"]) as writer:
         for j in range(size2):
             idx = proc_idx*size+j  # ith tfrec * num_img per tfrec as the start of this iteration
-            image = get_image(raster_paths[idx], cfg["channel"])
-            image_serial = serialize_image(image, cfg["out_precision"])
-
-            label, label_gdf = get_label(raster_paths[idx], vector_paths[idx], cfg["load_fix"])
-            label_serial = serialize_label(label)
-
-            fn = os.path.basename(raster_paths[idx]).split('.')[0]
-
-            feature = {
-                'image': _bytes_feature(image_serial.numpy()),
-                'label': _bytes_feature(label_serial.numpy()),
-                'fn' : _bytes_feature(tf.compat.as_bytes(fn))
-            }
-
             # write tfrecords
-            example = tf.train.Example(features=tf.train.Features(feature=feature))
-            writer.write(example.SerializeToString())
+            writer.write(serialize_example(raster_paths[idx], vector_paths[idx], cfg, split))
             
             # if j%50==0: print(f'{j} / {size2}')
 
 
-def read_tfrecord(serialized_example):
+# cfg and split of the create_tfrecord_pipelined worker processes
+_worker_args = None
+
+def _init_example_worker(cfg, split):
+    global _worker_args
+    _worker_args = (cfg, split)
+
+def _serialize_example_worker(paths):
+    return serialize_example(*paths, *_worker_args)
+
+def _write_shards(shard_queue, slots, errors, base_fn, size, tot_ex, tot_tf, compression=None):
+    """writer thread, writes the (shard_idx, example) of its queue in order
+    until it gets None. releases one of slots per example written, an
+    exception is appended to errors for the main thread to raise"""
+    writer = None
+    shard_idx = None
+    try:
+        while True:
+            item = shard_queue.get()
+            if item is None:
+                break
+            if item[0] != shard_idx:
+                if writer is not None:
+                    writer.close()
+                shard_idx = item[0]
+                print(f'Writing TFRecord {shard_idx} of {tot_tf}..')
+                size2 = min(size, tot_ex - shard_idx*size)  # size=size2 unless for remaining in last file
+                writer = TFRecordWriter(f'{base_fn}{shard_idx:02}-{size2}.tfrec', compression)
+            writer.write(item[1])
+            slots.release()
+    except Exception as e:
+        errors.append(e)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def _acquire_slot(slots, errors):
+    """waits for a free slot, raises the exception of a failed writer thread"""
+    while not slots.acquire(timeout=1):
+        if errors:
+            raise errors[0]
+
+def create_tfrecord_pipelined(base_fn, split, cfg, processes=4, writers=2, max_pending=256):
+    """writes all tfrecords of a split, same files as create_tfrecord_parallel
+        for each proc_idx, as a pipeline:
+        - tile paths are listed and shuffled once
+        - worker processes serialize examples, handed out one at a time
+          so they are balanced by example and not by shard
+        - writer threads stream them, in order, into the shards over
+          queues (shard i goes to writer i % writers)
+        an exception of a writer thread stops the pipeline and is raised
+    max_pending : int
+        max examples being serialized or waiting to be written, in total.
+        peak memory is about max_pending serialized examples
+    """
+    raster_paths, vector_paths = get_tile_paths(cfg, split, shuffle=True)
+    size = cfg["tfrec_size"]
+    tot_ex = len(raster_paths)  # total examples
+    tot_tf = int(np.ceil(tot_ex/size))  # total tfrecords
+    writers = max(1, min(writers, tot_tf))
+
+    # a slot per example from its submission until it is written, the
+    # queues are bounded by the slots
+    slots = threading.Semaphore(max_pending)
+    errors = []
+    queues = [queue.Queue() for _ in range(writers)]
+    threads = [threading.Thread(target=_write_shards,
+                                args=(q, slots, errors, base_fn, size, tot_ex, tot_tf,
+                                      cfg["tfrec_compression"]))
+               for q in queues]
+    for t in threads:
+        t.start()
+    try:
+        with Pool(processes, initializer=_init_example_worker, initargs=(cfg, split)) as pool:
+            # sliding window of examples, collected in order
+            tasks = zip(raster_paths, vector_paths)
+            pending = deque()
+            for paths in islice(tasks, max_pending):
+                _acquire_slot(slots, errors)
+                pending.append(pool.apply_async(_serialize_example_worker, (paths,)))
+            idx = 0
+            while pending:
+                example = pending.popleft().get()
+                shard_idx = idx // size
+                queues[shard_idx % writers].put((shard_idx, example))
+                idx += 1
+                # after the put, so the example's slot can be freed by a writer
+                for paths in islice(tasks, 1):
+                    _acquire_slot(slots, errors)
+                    pending.append(pool.apply_async(_serialize_example_worker, (paths,)))
+    finally:
+        # unbounded queues, the sentinels never block
+        for q in queues:
+            q.put(None)
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+
+
+def read_tfrecord(serialized_example, image_codec='raw', label_codec='raw', out_precision=32):
     """
-    assumes precision is tf.float32, change to tf.uint16 or tf.uint8 if required
+    out_precision 8, 16 or 32 gives a tf.uint8, tf.uint16 or tf.float32 image
+    codecs and out_precision are those of the cfg the tfrecords were made with,
+    use functools.partial(read_tfrecord, image_codec=..) to map a dataset
+    compressed tfrecords are read with
+        tf.data.TFRecordDataset(fns, compression_type=cfg["tfrec_compression"])
     """
+    import tensorflow as tf  # only needed to read, writing is TF-free
     tfrec_format = {
         'image': tf.io.FixedLenFeature([], tf.string),
         'label': tf.io.FixedLenFeature([], tf.string),
@@ -270,7 +580,34 @@ def read_tfrecord(serialized_example):
     }
 
     res_features = tf.io.parse_single_example(serialized_example, tfrec_format)
-    image = tf.io.parse_tensor(res_features['image'], tf.float32)
-    label = tf.io.parse_tensor(res_features['label'], tf.bool)
+    dtype = {8: tf.uint8, 16: tf.uint16}.get(out_precision, tf.float32)
+    if image_codec == 'png':
+        image = tf.io.decode_png(res_features['image'], dtype=dtype)
+    else:
+        image = tf.io.parse_tensor(res_features['image'], dtype)
+    if label_codec == 'bits':
+        packed = tf.io.parse_tensor(res_features['label'], tf.uint8)
+        bits = tf.bitwise.right_shift(packed[..., None], tf.constant([7, 6, 5, 4, 3, 2, 1, 0], dtype=tf.uint8))
+        bits = tf.bitwise.bitwise_and(bits, 1)
+        label = tf.reshape(tf.cast(bits, tf.bool), tf.concat([tf.shape(packed)[:-1], [-1]], 0))
+    else:
+        label = tf.io.parse_tensor(res_features['label'], tf.bool)
     fn = res_features['fn']
-    return image, label, fn
\ No newline at end of file
+    return image, label, fn
+
+def test_serialize_image():
+    """test function, png round trip of a transposed (to_hwc) uint16 image
+    through serialize_image and read_tfrecord
+    """
+    chw = np.random.rand(3, 40, 30).astype(np.float32)
+    hwc = to_hwc(chw)  # not contiguous
+    for out_precision in [8, 16]:
+        feature = {
+            'image': serialize_image(hwc, out_precision, 'png'),
+            'label': serialize_label(np.zeros((40, 30), dtype=bool)),
+            'fn': b'test'
+        }
+        image, _, _ = read_tfrecord(encode_example(feature), image_codec='png',
+                                    out_precision=out_precision)
+        expected = (hwc*(2**out_precision - 1)).astype(image.numpy().dtype)
+        assert np.array_equal(image.numpy(), expected), out_precision
@@ -0,0 +1,113 @@
+"""on-disk cache of preprocessed tiles (normalised image and label mask), so
+tfrecords can be written again with another precision, codec, shard size or
+perc_data without the raster and vector work
+an entry is a set of .npy files named by a hash of the tile files (path, mtime,
+size) and the cfg fields that change the arrays, read back memory-mapped
+"""
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from solaris.vector_tile import split_tile_path
+
+# bump when the cached arrays change for the same files and cfg
+CACHE_VERSION = 1
+# cfg fields that change the cached image or label
+KEY_FIELDS = ['channel', 'norm_mode', 'clip_quantiles', 'label_engine',
+              'load_fix', 'vector_format', 'label_dir', 'stride']
+PARTS = ['image', 'mask', 'label']  # label is written last, marks a complete entry
+
+
+def _file_id(path):
+    """absolute path, mtime and size of a file, None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [os.path.abspath(path), stat.st_mtime_ns, stat.st_size]
+
+class TileCache:
+    """
+    cache_dir : str
+    max_bytes : int
+        evict removes the least recently used entries above this size
+    """
+    def __init__(self, cache_dir, max_bytes=20*2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, raster_path, vector_path, cfg, extra_paths=()):
+        """hash of the tile files, extra files the arrays depend on
+        (the stats of the global norm_mode, the label sources of the
+        'direct' and 'stripe' label_engine) and cfg[KEY_FIELDS]
+        returns : str
+        """
+        files = [_file_id(p) for p in (raster_path, split_tile_path(vector_path)[0], *extra_paths)]
+        fields = {field: cfg[field] for field in KEY_FIELDS}
+        blob = json.dumps([CACHE_VERSION, files, fields], sort_keys=True)
+        return hashlib.sha1(blob.encode()).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return {part: f'{base}_{part}.npy' for part in PARTS}
+
+    def get(self, key):
+        """cached (image, label), None on a miss
+        image is a masked array if it was cached as one
+        """
+        paths = self._paths(key)
+        if not os.path.exists(paths['label']):
+            return None
+        label = np.load(paths['label'], mmap_mode='r')
+        image = np.load(paths['image'], mmap_mode='r')
+        if os.path.exists(paths['mask']):
+            image = np.ma.masked_array(image, mask=np.load(paths['mask']))
+        os.utime(paths['label'])  # recently used, for evict
+        return image, label
+
+    def put(self, key, image, label):
+        """saves an entry, each file is written to a temporary name and moved
+        in place so other processes never read a partial entry
+        """
+        arrays = {'image': np.ma.getdata(image), 'label': np.asarray(label)}
+        if np.ma.is_masked(image):
+            arrays['mask'] = np.ma.getmaskarray(image)
+        paths = self._paths(key)
+        os.makedirs(os.path.dirname(paths['label']), exist_ok=True)
+        for part in PARTS:
+            if part in arrays:
+                tmp_path = f'{paths[part]}.{os.getpid()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, arrays[part])
+                os.replace(tmp_path, paths[part])
+
+    def evict(self):
+        """removes the least recently used entries until the cache is
+        under max_bytes
+        returns : int
+            number of entries removed
+        """
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for fn in files:
+                if not fn.endswith('_label.npy'):
+                    continue
+                paths = [p for p in self._paths(fn[:-len('_label.npy')]).values()
+                         if os.path.exists(p)]
+                size = sum(os.path.getsize(p) for p in paths)
+                entries.append((os.path.getmtime(os.path.join(root, fn)), size, paths))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, paths in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # label first, so a reader never sees an entry without its image
+            for path in reversed(paths):
+                os.remove(path)
+            total -= size
+            removed += 1
+        return removed
@@ -2,35 +2,69 @@ import os
 import random
 import pickle
 import json
+import queue
 from multiprocessing import Pool
 
+import rasterio as rs
+import numpy as np
 from numpy import ceil
 from timebudget import timebudget
 
 from dataset_cfg import cfg
 from sar_preproc import SarPreproc
-from tile_scheme import parallel_tile_generator
+from tile_scheme import write_tile
+from lib.labels import get_label_gdf
+from lib.manifest import list_tile_fns, parse_tile_fn, read_manifest, write_manifest
 
-def create_s_fn(raster_dir):
+def select_tiles(fns, frac, seed=17, strata=None):
+    """shuffled fraction of tile filenames, taken from each stratum on its own
+    fns: list of tile filenames
+    frac: float [0,1], ceil(frac*n) tiles are taken from each stratum
+    seed: int, seed of the shuffle
+    strata: list, stratum of each fn (see get_strata), None for one stratum
+    returns: list of selected filenames
+    """
+    if strata is None:
+        strata = [None] * len(fns)
+    groups = {}
+    for fn, stratum in zip(fns, strata):
+        groups.setdefault(stratum, []).append(fn)
+
+    selected = []
+    for stratum in sorted(groups, key=str):
+        group = sorted(groups[stratum])
+        random.Random(seed).shuffle(group)
+        selected.extend(group[:int(ceil(len(group)*frac))])
+    return selected
+
+def get_strata(cfg, fns, by):
+    """stratum of each tile filename
+    by: 'orient', or 'buildings' for building count bins (0, 1-9, 10-49, 50+)
+        from the tile manifest
+    """
+    if by == 'orient':
+        return [parse_tile_fn(fn)['orient'] for fn in fns]
+    if by == 'buildings':
+        manifest = read_manifest(cfg, 'train', columns=['fn', 'n_buildings'])
+        n_buildings = dict(zip(manifest['fn'], manifest['n_buildings']))
+        return np.digitize([n_buildings[fn] for fn in fns], [1, 10, 50]).tolist()
+    raise ValueError(f'unknown stratification {by}')
+
+def create_s_fn(raster_dir, stratify=None):
     """raster_dir: name of folder where you full rasters have been saved
         ex: base or base_s80
+    stratify: None, 'orient' or 'buildings', see get_strata
     """
     # full_raster_path = '../../dataset/sensor/base/raster'
     full_raster_path = os.path.join(cfg["out_dir"], raster_dir, 'raster')
-    s_train_fn = os.listdir(full_raster_path)
-    print(f'total rasters in {full_raster_path}: {len(s_train_fn)}')
-    
-    # filter only 'train'
-    s_train_fn = [fn for fn in s_train_fn if 'train' in fn]
-    print(f'total train rasters: {len(s_train_fn)}')
-    
-    # sort and shuffle
-    s_train_fn.sort()
-    random.Random(17).shuffle(s_train_fn)
-    # take percentage of it
-    tot_len = len(s_train_fn)
-    per_len = int(ceil(tot_len*cfg["perc_data"]))
-    s_train_fn = s_train_fn[:per_len]
+    # sorted 'train' rasters, from the tile manifest of raster_dir if it has one
+    raster_cfg = dict(cfg, name=raster_dir)
+    s_train_fn = list_tile_fns(raster_cfg, 'train')
+    print(f'total train rasters in {full_raster_path}: {len(s_train_fn)}')
+
+    # shuffle and take percentage of it
+    strata = get_strata(raster_cfg, s_train_fn, stratify) if stratify else None
+    s_train_fn = select_tiles(s_train_fn, cfg["perc_data"], strata=strata)
     print(f'taking: {len(s_train_fn)} shuffled rasters')
 
     # save shuffled list
@@ -41,25 +75,50 @@ def create_s_list():
     with open('s_fn.pickle', 'rb') as f:
         s_train_fn = pickle.load(f)  # len 1757
 
-    # get unique timestamps
-    timestamps = []
-    for fn in s_train_fn:
-        sp = fn.split('_')
-        timestamps.append(f'{sp[1]}_{sp[2]}')
+    s_list = group_tile_ids(s_train_fn)
+    print(f'{len(s_list)} unique timestamps')
 
-    timestamps = set(timestamps)  # len 202 (all slices)
-    print(f'{len(timestamps)} unique timestamps')
+    with open('s_list.pickle','wb') as f:
+        pickle.dump(s_list, f)
 
-    s_list = []
+def group_tile_ids(fns):
+    """tile ids of each timestamp
     # sensor_20190804111224_20190804111453_o1_base_test_s0_0000.tif
     # [['20190804111224_20190804111453', ['0000','0020', ...]], ...]
-    for ts in timestamps:
-        tile_ids = [fn.split('.')[0][-4:] for fn in s_train_fn if ts in fn]
-        tile_ids.sort()
-        s_list.append([ts, tile_ids])
+    """
+    tile_ids = {}
+    for fn in fns:
+        fields = parse_tile_fn(fn)
+        tile_ids.setdefault(fields['timestamp'], []).append(fields['tile_id'])
+    return [[ts, sorted(ids)] for ts, ids in tile_ids.items()]
 
-    with open('s_list.pickle','wb') as f:
-        pickle.dump(s_list, f)
+def index_schemes(sch_dir, split='train'):
+    """{(timestamp, tile_id): [name, bound, profile]} of the tile schemes of a
+    split, each scheme file loaded once
+    """
+    index = {}
+    for sch_fn in sorted(os.listdir(sch_dir)):
+        if not sch_fn.endswith(f'_{split}.pickle'):
+            continue
+        with open(os.path.join(sch_dir, sch_fn), 'rb') as f:
+            for tile_scheme in pickle.load(f):
+                fields = parse_tile_fn(tile_scheme[0])
+                index[(fields['timestamp'], fields['tile_id'])] = tile_scheme
+    return index
+
+def save_s_schemes(s_list, index, save_sch_dir):
+    """saves the schemes of the tile ids of each timestamp as
+    save_sch_dir/{timestamp}
+    s_list: [[timestamp, tile_ids],...]
+    """
+    if not os.path.isdir(save_sch_dir):
+        os.makedirs(save_sch_dir)
+    for timestamp, tile_ids in s_list:
+        s_tile_scheme = [index[(timestamp, tile_id)] for tile_id in tile_ids
+                         if (timestamp, tile_id) in index]
+        save_fn = os.path.join(save_sch_dir, timestamp)
+        with open(save_fn, 'wb') as f:
+            pickle.dump(s_tile_scheme, f)
 
 def create_s_scheme():
     """
@@ -75,82 +134,144 @@ def create_s_scheme():
     # save_sch_dir = '../../dataset/sensor/s0/s_tile_scheme'
     save_sch_dir = os.path.join(cfg["out_dir"], f's{cfg["stride"]}', 's_tile_scheme')
 
-    # grab just train schemes
-    train_sch_path = os.listdir(full_sch_dir)
-    train_sch_path = [sch for sch in train_sch_path if 'train' in sch]
+    # train schemes indexed by (timestamp, tile_id)
+    index = index_schemes(full_sch_dir, 'train')
+    save_s_schemes(s_list, index, save_sch_dir)
 
-    # filter train_sch_path contained in timestamp
-    for timestamp, tile_ids in s_list:
-        for sch_path in train_sch_path:
-            if timestamp in sch_path:  # if timestamp is contained in the path
-                load_fn = os.path.join(full_sch_dir, sch_path)
-                # load tile_schemes containing: [[name, bound, profile],..]
-                with open(load_fn, 'rb') as f:
-                    tile_schemes = pickle.load(f)
-                
-                # filter elements of tile_scheme contained in tile_ids
-                s_tile_scheme = []
-                for tile_id in tile_ids:
-                    for tile_scheme in tile_schemes:  
-                        if tile_id in tile_scheme[0]:  # if tile_scheme contained in name (1st element)
-                            s_tile_scheme.append(tile_scheme)
+def create_s_subset(raster_dir, stratify=None):
+    """create_s_fn, create_s_list and create_s_scheme in one go,
+    without the intermediate pickles
+    """
+    raster_cfg = dict(cfg, name=raster_dir)
+    s_train_fn = list_tile_fns(raster_cfg, 'train')
+    strata = get_strata(raster_cfg, s_train_fn, stratify) if stratify else None
+    s_train_fn = select_tiles(s_train_fn, cfg["perc_data"], strata=strata)
+    print(f'taking: {len(s_train_fn)} shuffled rasters')
 
-                # save the filtered tile_schemes
-                save_fn = os.path.join(save_sch_dir, timestamp)
-                with open(save_fn, 'wb') as f:
-                    pickle.dump(s_tile_scheme, f)
+    sch_dir = os.path.join(cfg["out_dir"], f's{cfg["stride"]}')
+    index = index_schemes(os.path.join(sch_dir, 'tile_scheme'), 'train')
+    save_s_schemes(group_tile_ids(s_train_fn), index, os.path.join(sch_dir, 's_tile_scheme'))
 
 
-def s_tiling(proc_idx):
-    s_scheme_dir = os.path.join(cfg["out_dir"], f's{cfg["stride"]}', 's_tile_scheme')
-    timestamps = os.listdir(s_scheme_dir)
+def get_slc_size(timestamp):
+    """bytes of the SLC files of a stripe, stripes are scheduled largest first"""
+    in_paths = [os.path.join(cfg["in_dir"], f'CAPELLA_ARL_SM_SLC_{pol}_{timestamp}.tif')
+                for pol in cfg['pol']]
+    return sum(os.path.getsize(p) for p in in_paths if os.path.exists(p))
 
-    # loop through timestamps
-    start_i = 50*(proc_idx)
-    end_i = start_i + 50
-    if proc_idx==3:
-        end_i = 202
+def preproc_stripe(timestamp):
+    """SarPreproc of a stripe into output_{timestamp}.tif. the name is unique
+    per stripe, so no two workers write (or tile from) the same file
+    returns: [out_path, ml_path], files to remove once the stripe is tiled
+    """
+    out_fn = f'output_{timestamp}.tif'
+    sar_preproc = SarPreproc(cfg, timestamp, cfg["in_dir"], cfg["out_dir"], out_fn)
+    with timebudget(f'SAR PRE-PROC {timestamp}'): sar_preproc()
+    return sar_preproc.out_path, sar_preproc.ml_path
 
-    for i, timestamp in enumerate(timestamps[start_i:end_i]):
-        print(f'processing raster {timestamp}.. {i+start_i} of {len(timestamps)}')
+def tile_stripe_batch(proc_slc_path, tile_schemes, save_path):
+    """writes a batch of tiles of a processed stripe, opening it once
+    returns: nodata fraction of each tile
+    """
+    src = rs.open(proc_slc_path)
+    snap = cfg["label_engine"] == 'stripe'
+    nodata_percs = [write_tile(src, tile_scheme, save_path, snap) for tile_scheme in tile_schemes]
+    src.close()
+    return nodata_percs
 
-        out_fn = f'output{proc_idx}.tif'
-        sar_preproc = SarPreproc(cfg, timestamp, cfg["in_dir"], cfg["out_dir"], out_fn)
-        with timebudget(f'SAR PRE-PROC {i+start_i}'): sar_preproc()
+def finish_stripe(timestamp, stripe, labels, done_dir):
+    """writes the manifest of a tiled stripe, removes its processed files
+    and marks it done
+    """
+    if cfg["tile_manifest"]:
+        nodata_percs = [perc for batch in stripe['nodata_percs'] for perc in batch]
+        write_manifest(cfg, stripe['tile_schemes'], nodata_percs, labels)
+    for path in stripe['paths']:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+    open(os.path.join(done_dir, timestamp), 'w').close()
 
-        sch_path = os.path.join(s_scheme_dir, timestamp)
-        with open(sch_path, 'rb') as f:
-            tile_schemes = pickle.load(f)
+def s_tiling(processes=4, batches_per_stripe=None):
+    """preprocesses and tiles the stripes of s_tile_scheme on a work queue:
+    - stripes are preprocessed largest SLC first, up to `processes` at a time
+    - once a stripe is preprocessed, its tiles are split in batches_per_stripe
+      batches (default processes) that any idle worker picks up, ahead of the
+      next stripe's preproc
+    - a stripe is marked in {name}/s_done once all its tiles are written,
+      a rerun skips those (stripes cut off halfway are redone)
+    """
+    s_scheme_dir = os.path.join(cfg["out_dir"], f's{cfg["stride"]}', 's_tile_scheme')
+    save_path = os.path.join(cfg["out_dir"], cfg["name"], 'raster') # where rasters are saved
+    done_dir = os.path.join(cfg["out_dir"], cfg["name"], 's_done')
+    if not os.path.isdir(done_dir):
+        os.makedirs(done_dir)
+    if batches_per_stripe is None:
+        batches_per_stripe = processes
+
+    timestamps = os.listdir(s_scheme_dir)
+    todo = [ts for ts in timestamps if not os.path.exists(os.path.join(done_dir, ts))]
+    todo.sort(key=get_slc_size, reverse=True)
+    n_todo = len(todo)
+    print(f'{n_todo} of {len(timestamps)} stripes to process')
+    # train labels, for the building count of the tile manifest
+    labels = get_label_gdf('train', cfg["label_dir"]) if cfg["tile_manifest"] else None
+
+    # results of the pool arrive as (kind, timestamp, batch_idx, result)
+    events = queue.Queue()
+    stripes = {}  # preprocessed stripes being tiled
+    n_tasks = 0
+    n_preproc = 0
+    n_done = 0
 
-        save_path = os.path.join(cfg["out_dir"], cfg["name"], 'raster') # where rasters are saved
-        proc_slc_path = os.path.join(cfg["out_dir"], out_fn)  # output.tif path
+    with Pool(processes) as pool:
+        def submit(func, args, kind, timestamp, batch_idx=None):
+            pool.apply_async(
+                func, args,
+                callback=lambda result: events.put((kind, timestamp, batch_idx, result)),
+                error_callback=lambda e: events.put(('error', timestamp, batch_idx, e)))
 
-        schemes = []
-        for tile_scheme in tile_schemes:
-            # for serial tiling
-            parallel_tile_generator(tile_scheme, proc_slc_path, save_path)
-            # for parallel
-            # schemes.append((tile_scheme, proc_slc_path, save_path))
+        while todo or n_tasks:
+            while todo and n_preproc < processes:
+                submit(preproc_stripe, (todo[0],), 'preproc', todo.pop(0))
+                n_preproc += 1
+                n_tasks += 1
+
+            kind, timestamp, batch_idx, result = events.get()
+            n_tasks -= 1
+            if kind == 'error':
+                raise result
+            if kind == 'preproc':
+                n_preproc -= 1
+                with open(os.path.join(s_scheme_dir, timestamp), 'rb') as f:
+                    tile_schemes = pickle.load(f)
+                size = max(1, int(ceil(len(tile_schemes) / batches_per_stripe)))
+                batches = [tile_schemes[i:i+size] for i in range(0, len(tile_schemes), size)]
+                stripes[timestamp] = {'tile_schemes': tile_schemes, 'paths': result,
+                                      'nodata_percs': [None]*len(batches), 'left': len(batches)}
+                for i, batch in enumerate(batches):
+                    submit(tile_stripe_batch, (result[0], batch, save_path), 'tile', timestamp, i)
+                    n_tasks += 1
+            else:
+                stripes[timestamp]['nodata_percs'][batch_idx] = result
+                stripes[timestamp]['left'] -= 1
 
-        # # for parallel tiling
-        # n_tile = len(tile_schemes)
-        # n_proc = int(ceil(n_tile/2))
-        # print(f'tiling with {n_proc} process')
-        # proc_pool = Pool(n_proc)
-        # proc_pool.starmap(parallel_tile_generator, schemes)
+            if stripes[timestamp]['left'] == 0:
+                finish_stripe(timestamp, stripes.pop(timestamp), labels, done_dir)
+                n_done += 1
+                print(f'tiled stripe {timestamp}.. {n_done} of {n_todo}')
 
 
 if __name__=='__main__':
     # create_s_fn('base_s80')
     # create_s_list()
     # create_s_scheme()
+    # or all three at once: create_s_subset('base_s80')
     save_path = os.path.join(cfg["out_dir"], cfg["name"], 'raster') # where rasters are saved
     if not os.path.isdir(save_path):
         os.makedirs(save_path)
 
     with timebudget('25% train tiling'):
-        proc_pool = Pool(4)
-        proc_pool.map(s_tiling, range(4))
+        s_tiling(processes=4)
     
     cfg_fn = os.path.join(save_path, 'cfg.json')
     with open(cfg_fn, 'w') as f:
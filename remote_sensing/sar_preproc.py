@@ -19,18 +19,50 @@ class SarPreproc(pipesegment.PipeSegment):
         super().__init__()
         out_path = os.path.join(out_dir, out_fn)
 
-        quads = [
-            image.LoadImage(os.path.join(input_dir, 'CAPELLA_ARL_SM_SLC_'
-                                         + pol + '_' + timestamp + '.tif'))
-            * sar.CapellaScaleFactor()
-            for pol in cfg['pol']]
+        in_paths = [os.path.join(input_dir, 'CAPELLA_ARL_SM_SLC_'
+                                 + pol + '_' + timestamp + '.tif')
+                    for pol in cfg['pol']]
 
-        self.feeder = (
-            np.sum(quads)  # in pipesegment, add operator calls MergeSegment
-            * image.MergeToStack()
-            * sar.Intensity()
-            * sar.Multilook(kernel_size=cfg['ml_size'], method=cfg['ml_filter'])
-            * sar.Decibels()
-            * sar.Orthorectify(projection=32631, row_res=.5, col_res=.5)
-            * image.SaveImage(out_path, return_image=False, no_data_value='nan')
-        )
\ No newline at end of file
+        self.out_path = out_path
+        self.ml_path = None
+        self.warp_on_demand = cfg['warp_on_demand']
+        if cfg['block_rows'] or cfg['warp_on_demand']:
+            # stream row strips through the radiometric chain into a
+            # GCP-referenced raster, then warp that file straight to out_path
+            self.ml_path = os.path.join(out_dir, 'ml_' + out_fn)
+            if cfg['warp_on_demand']:
+                # only write a warped VRT, tiles are warped when read from it
+                self.out_path = os.path.splitext(out_path)[0] + '.vrt'
+            self.feeder = (
+                sar.BlockRadiometry(in_paths, self.ml_path,
+                                    kernel_size=cfg['ml_size'],
+                                    method=cfg['ml_filter'],
+                                    block_rows=cfg['block_rows'] or None)
+                * sar.Orthorectify(projection=32631, row_res=.5, col_res=.5,
+                                   dstpath=self.out_path,
+                                   warp_memory=cfg['warp_memory'],
+                                   num_threads=cfg['warp_threads'],
+                                   format='VRT' if cfg['warp_on_demand'] else None)
+            )
+        else:
+            quads = [image.LoadImage(in_path) for in_path in in_paths]
+
+            self.feeder = (
+                np.sum(quads)  # in pipesegment, add operator calls MergeSegment
+                # scale factor, stack, intensity, multilook and dB in one pass
+                * sar.CalibratedMultilookDb(kernel_size=cfg['ml_size'],
+                                            method=cfg['ml_filter'],
+                                            workers=cfg['ml_workers'])
+                # warp straight from the numpy buffer into out_path
+                * sar.Orthorectify(projection=32631, row_res=.5, col_res=.5,
+                                   dstpath=out_path, in_memory=True,
+                                   warp_memory=cfg['warp_memory'],
+                                   num_threads=cfg['warp_threads'])
+            )
+
+    def transform(self, pin):
+        # the warped VRT still reads from the multilooked stripe
+        if self.ml_path is not None and not self.warp_on_demand \
+           and os.path.exists(self.ml_path):
+            os.remove(self.ml_path)
+        return pin
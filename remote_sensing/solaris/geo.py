@@ -14,6 +14,8 @@ from shapely.geometry import Point, Polygon, LineString
 from shapely.geometry import MultiLineString, MultiPolygon, mapping, box, shape
 from shapely.geometry.collection import GeometryCollection
 from shapely.ops import cascaded_union
+from shapely.prepared import prep
+import shapely
 from osgeo import osr
 from osgeo import gdal
 import json
@@ -741,7 +743,8 @@ def polygon_to_coco(polygon):
 
 
 def split_geom(geometry, tile_size, resolution=None,
-               use_projection_units=False, src_img=None, stride=(0,0)):
+               use_projection_units=False, src_img=None, stride=(0,0),
+               return_array=False, return_coverage=False):
     """Splits a vector into approximately equal sized tiles.
 
     Adapted from @lossyrob's Gist__
@@ -776,10 +779,19 @@ def split_geom(geometry, tile_size, resolution=None,
         as the geometry.
     stride:  `tuple` of `int`
         stride in ``(y,x)`` coordinates, just like tile_size. stride is overlapping between adjacent tiles
+    return_array : bool, optional
+        Return `tile_bounds` as an ``(N, 4)`` :class:`numpy.ndarray` instead
+        of a list of tuples. Defaults to ``False``.
+    return_coverage : bool, optional
+        Also return the fraction of each tile's area covered by `geometry`.
+        Defaults to ``False``.
 
     Returns
     -------
-    tile_bounds : list (containing sublists like [left, bottom, right, top])
+    tile_bounds : list (containing tuples like (left, bottom, right, top))
+        or :class:`numpy.ndarray` if ``return_array=True``.
+    coverage : :class:`numpy.ndarray`
+        Covered fraction of each tile, only if ``return_coverage=True``.
 
     """
     if isinstance(geometry, str):
@@ -840,9 +852,86 @@ def split_geom(geometry, tile_size, resolution=None,
     y_mins = np.arange(ymin,
                     ymin + (tmp_tile_size[0]-tmp_stride[0])*y_steps,
                     tmp_tile_size[0]-tmp_stride[0])
-    tile_bounds = [
-        (i, j, i+tmp_tile_size[1], j+tmp_tile_size[0])
-        for i in x_mins for j in y_mins if not geometry.intersection(
-            box(*(i, j, i+tmp_tile_size[1], j+tmp_tile_size[0]))).is_empty
-        ]
+    # candidate grid, in the same x-major order as the previous
+    # list comprehension: [(i, j, ...) for i in x_mins for j in y_mins]
+    x_grid, y_grid = np.meshgrid(x_mins, y_mins, indexing='ij')
+    candidates = np.stack([x_grid.ravel(), y_grid.ravel(),
+                           x_grid.ravel() + tmp_tile_size[1],
+                           y_grid.ravel() + tmp_tile_size[0]], axis=1)
+    keep = _intersects_boxes(geometry, candidates)
+    tile_bounds = candidates[keep]
+
+    if return_coverage:
+        coverage = _box_coverage(geometry, tile_bounds)
+    if not return_array:
+        tile_bounds = [tuple(tb) for tb in tile_bounds]
+    if return_coverage:
+        return tile_bounds, coverage
     return tile_bounds
+
+
+def snap_bounds(bounds, transform):
+    """Snap tile bounds to the pixel grid of a raster.
+
+    The window of each tile is rounded the way rasterio rounds the window of
+    a read (offsets and lengths to the nearest pixel, halves up), so a tile
+    read with its snapped bounds holds the same pixels as with the original
+    ones, and its transform now lies on the grid of the source.
+
+    Arguments
+    ---------
+    bounds : `list`-like
+        A ``[left, bottom, right, top]`` tile bound, or an ``(N, 4)`` array of
+        them, in the CRS of `transform`.
+    transform : :class:`affine.Affine`
+        The north-up transform of the source raster.
+
+    Returns
+    -------
+    snapped : tuple or :class:`numpy.ndarray`
+        ``(left, bottom, right, top)`` for a single bound, else an ``(N, 4)``
+        array.
+
+    """
+    tb = np.asarray(bounds, dtype=np.float64)
+    single = tb.ndim == 1
+    tb = tb.reshape(-1, 4)
+    inv = ~transform
+    col0, row0 = inv * (tb[:, 0], tb[:, 3])
+    col1, row1 = inv * (tb[:, 2], tb[:, 1])
+    cols = np.floor(col0 + .5)
+    rows = np.floor(row0 + .5)
+    width = np.floor(col1 - col0 + .5)
+    height = np.floor(row1 - row0 + .5)
+    left, top = transform * (cols, rows)
+    right, bottom = transform * (cols + width, rows + height)
+    snapped = np.stack([left, bottom, right, top], axis=1)
+    if single:
+        return tuple(snapped[0])
+    return snapped
+
+
+def _intersects_boxes(geometry, boxes):
+    """Boolean mask of the ``(N, 4)`` `boxes` that intersect `geometry`."""
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=bool)
+    if hasattr(shapely, 'intersects'):  # shapely >= 2.0, vectorised
+        shapely.prepare(geometry)
+        return shapely.intersects(geometry, shapely.box(*boxes.T))
+    prepared = prep(geometry)
+    return np.array([prepared.intersects(box(*b)) for b in boxes],
+                    dtype=bool)
+
+
+def _box_coverage(geometry, boxes):
+    """Fraction of the area of each ``(N, 4)`` box covered by `geometry`."""
+    if len(boxes) == 0:
+        return np.zeros(0)
+    box_area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if hasattr(shapely, 'intersection'):  # shapely >= 2.0, vectorised
+        inter_area = shapely.area(
+            shapely.intersection(geometry, shapely.box(*boxes.T)))
+    else:
+        inter_area = np.array([geometry.intersection(box(*b)).area
+                               for b in boxes])
+    return inter_area / box_area
@@ -48,6 +48,11 @@ class LoadImageFromDisk(LoadSegment):
         dataset = gdal.Open(pathstring)
         if dataset is None:
             raise Exception('! Image file ' + pathstring + ' not found.')
+        if name is None:
+            name = os.path.splitext(os.path.split(pathstring)[1])[0]
+        return self.load_from_dataset(dataset, name, verbose)
+    def load_from_dataset(self, dataset, name='image', verbose=False):
+        # Read an already-open GDAL dataset, e.g. an in-memory one
         data = dataset.ReadAsArray()
         if data.ndim == 2:
             data = np.expand_dims(data, axis=0)
@@ -60,8 +65,6 @@ class LoadImageFromDisk(LoadSegment):
         }
         metadata['band_meta'] = [dataset.GetRasterBand(band).GetMetadata()
                                  for band in range(1, dataset.RasterCount+1)]
-        if name is None:
-            name = os.path.splitext(os.path.split(pathstring)[1])[0]
         dataset = None
         # Create an Image-class object, and return it
         imageobj = Image(data, name, metadata)
@@ -111,6 +114,23 @@ class LoadImage(LoadImageFromDisk, LoadImageFromMemory):
             raise Exception('! Invalid input type in LoadImage.')
 
 
+def set_projection(dataset, metadata):
+    """
+    Set the geotransform and projection, or the GCPs, of a GDAL dataset
+    from Image metadata, whichever projection system is used.
+    """
+    proj_lens = [0, 0]
+    proj_keys = ['projection_ref', 'gcp_projection']
+    for i, proj_key in enumerate(proj_keys):
+        if proj_key in metadata.keys():
+            proj_lens[i] = len(metadata[proj_key])
+    if proj_lens[0] > 0 and proj_lens[0] >= proj_lens[1]:
+        dataset.SetGeoTransform(metadata['geotransform'])
+        dataset.SetProjection(metadata['projection_ref'])
+    elif proj_lens[1] > 0 and proj_lens[1] >= proj_lens[0]:
+        dataset.SetGCPs(metadata['gcps'], metadata['gcp_projection'])
+
+
 class SaveImage(PipeSegment):
     """
     Save an image to disk using GDAL.
@@ -145,18 +165,7 @@ class SaveImage(PipeSegment):
                 bandptr.SetNoDataValue(self.no_data_value)
             bandptr.FlushCache()
         if self.save_projection:
-            #First determine which projection system, if any, is used
-            proj_lens = [0, 0]
-            proj_keys = ['projection_ref', 'gcp_projection']
-            for i, proj_key in enumerate(proj_keys):
-                if proj_key in pin.metadata.keys():
-                    proj_lens[i] = len(pin.metadata[proj_key])
-            if proj_lens[0] > 0 and proj_lens[0] >= proj_lens[1]:
-                dataset.SetGeoTransform(pin.metadata['geotransform'])
-                dataset.SetProjection(pin.metadata['projection_ref'])
-            elif proj_lens[1] > 0 and proj_lens[1] >= proj_lens[0]:
-                dataset.SetGCPs(pin.metadata['gcps'],
-                                pin.metadata['gcp_projection'])
+            set_projection(dataset, pin.metadata)
         if self.save_metadata and 'meta' in pin.metadata.keys():
             dataset.SetMetadata(pin.metadata['meta'])
         dataset.FlushCache()
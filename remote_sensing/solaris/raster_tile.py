@@ -4,9 +4,12 @@ from rasterio.warp import Resampling, calculate_default_transform
 from rasterio.vrt import WarpedVRT
 from rasterio.mask import mask as rasterio_mask
 from .core import _check_crs, _check_rasterio_im_load
-from .geo import reproject, split_geom, raster_get_projection_unit
+from .geo import reproject, split_geom, snap_bounds, raster_get_projection_unit
 
 import numpy as np
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from shapely.geometry import box
 from tqdm.auto import tqdm
 
@@ -57,6 +60,18 @@ class RasterTiler(object):
         will be generated from the `aoi_boundary` based on `src_tile_size`.
     verbose : bool, optional
         Verbose text output. By default, verbose text is not printed.
+    min_coverage : float, optional
+        Tiles whose area is covered by less than this fraction of the
+        `aoi_boundary` (intersected with the image bounds) are dropped when
+        tile bounds are generated, before any pixels are read. By default,
+        every tile touching the AOI is kept.
+    snap_to_grid : bool, optional
+        Snap generated tile bounds to the pixel grid of `src` (see
+        :func:`solaris.geo.snap_bounds`). Tiles hold the same pixels, but
+        their transforms (and `tile_bounds`, `tile_scheme`) lie on the grid
+        instead of carrying the sub-pixel offset of the AOI, so labels
+        rasterised on a tile line up with labels rasterised on `src`.
+        Defaults to ``False``.
 
     Attributes
     ----------
@@ -106,7 +121,8 @@ class RasterTiler(object):
                  dest_tile_size=None, dest_metric_size=False,
                  aoi_boundary=None, nodata=None, alpha=None,
                  force_load_cog=False, resampling=None, tile_bounds=None,
-                 verbose=False, stride=(0,0)):
+                 verbose=False, stride=(0,0), min_coverage=None,
+                 snap_to_grid=False):
         # set up attributes
         if verbose:
             print("Initializing Tiler...")
@@ -131,10 +147,13 @@ class RasterTiler(object):
         self.tile_bounds = tile_bounds
         self.project_to_meters = project_to_meters
         self.tile_paths = []  # retains the paths of the last call to .tile()
+        self.tile_nodata = []  # nodata fraction of each of the tile_paths
 #        self.cog_output = cog_output
         self.verbose = verbose
         self.tile_scheme = []
         self.stride = stride
+        self.min_coverage = min_coverage
+        self.snap_to_grid = snap_to_grid
         if self.verbose:
             print('Tiler initialized.')
             print('dest_dir: {}'.format(self.dest_dir))
@@ -152,7 +171,9 @@ class RasterTiler(object):
 
     def tile(self, src, dest_dir=None, channel_idxs=None, nodata=None,
              alpha=None, restrict_to_aoi=False,
-             dest_fname_base=None, nodata_threshold = None):
+             dest_fname_base=None, nodata_threshold = None,
+             screen_factor=None, screen_margin=None, cache_bytes=None,
+             block_order=False, workers=1):
         """An object to tile geospatial image strips into smaller pieces.
 
         Arguments
@@ -163,6 +184,32 @@ class RasterTiler(object):
             Nodata percentages greater than this threshold will not be saved as tiles.
         restrict_to_aoi : bool, optional
             Requires aoi_boundary. Sets all pixel values outside the aoi_boundary to the nodata value of the src image.
+        screen_factor : int, optional
+            Used with `nodata_threshold`. The valid-data mask of `src` is read
+            once, downsampled by this factor, to estimate each tile's nodata
+            percentage; tiles estimated above ``nodata_threshold + screen_margin``
+            are skipped without reading their pixels. Tiles that are read are
+            still checked exactly. By default, every tile is read.
+        screen_margin : float, optional
+            Tolerance on the estimated nodata percentage. Defaults to
+            ``4 * screen_factor / min(src_tile_size)``, the share of a tile
+            touched by its edge cells in the downsampled mask.
+        cache_bytes : int, optional
+            Read tiles through a :class:`BlockCache` of decoded source blocks
+            capped at this many bytes, so blocks shared by overlapping tiles
+            are decoded once. Hit/miss counters are kept on
+            ``self.block_cache``. By default, each tile is read directly.
+        block_order : bool, optional
+            Read tiles row-major by source block so the cache stays hot.
+            Tiles are saved under temporary names and renamed at the end, so
+            tile ids, `tile_paths`, `tile_bounds` and `tile_scheme` keep the
+            default order.
+        workers : int, optional
+            Number of threads reading, reprojecting and saving tiles, each
+            with its own handle on `src` (and its own block cache of
+            ``cache_bytes / workers``). Tiles are saved under temporary names
+            and renamed in order at the end, so the output is the same as
+            with the default of ``1``.
         """
         src = _check_rasterio_im_load(src)
         restricted_im_path = os.path.join(self.dest_dir, "aoi_restricted_"+ os.path.basename(src.name))
@@ -181,43 +228,73 @@ class RasterTiler(object):
                 src.close()
             src = _check_rasterio_im_load(restricted_im_path) #if restrict_to_aoi, we overwrite the src to be the masked raster
 
+        if nodata_threshold is None:
+            screen_factor = None
+        if cache_bytes and workers <= 1:
+            self.block_cache = BlockCache(src, cache_bytes)
+        else:
+            self.block_cache = None
         tile_gen = self.tile_generator(src, dest_dir, channel_idxs, nodata,
-                                       alpha, self.aoi_boundary, restrict_to_aoi)
+                                       alpha, self.aoi_boundary, restrict_to_aoi,
+                                       nodata_threshold, screen_factor,
+                                       screen_margin, block_order,
+                                       return_index=True)
 
         if self.verbose:
             print('Beginning tiling...')
         self.tile_paths = []
+        self.tile_nodata = []
         tile_id = 0  # keeping track of tile number for each stripe
         if nodata_threshold is not None:
             if nodata_threshold > 1:
                 raise ValueError("nodata_threshold should be expressed as a float less than 1.")
             # print("nodata value threshold supplied, filtering based on this percentage.")
-            new_tile_bounds = []
-            for tile_data, mask, profile, tb in tqdm(tile_gen):
-                if np.isnan(profile['nodata']):
-                    nodata_count = np.count_nonzero(np.isnan(tile_data[0]))
-                else:
-                    nodata_count = np.logical_or.reduce((tile_data == profile['nodata']), axis=0).sum()
-                nodata_perc = nodata_count / (tile_data.shape[1] * tile_data.shape[2])
-                if nodata_perc < nodata_threshold:
-                    dest_path = self.save_tile(
-                        tile_data, mask, profile, tile_id, dest_fname_base)
-                    self.save_scheme(
-                        tb, profile, tile_id, dest_fname_base
-                    )
-                    self.tile_paths.append(dest_path)
-                    new_tile_bounds.append(tb)
-                    tile_id += 1
-                else:
-                    if self.verbose==2:
-                        print("{} of nodata is over the nodata_threshold, tile not saved.".format(nodata_perc))
+        new_tile_bounds = []
+        # [index, tmp_path, tb, profile, nodata_perc] with block_order or workers
+        unordered = []
+        if workers > 1:
+            unordered = self._tile_parallel(
+                src, channel_idxs, nodata, alpha, nodata_threshold,
+                screen_factor, screen_margin, block_order, cache_bytes,
+                dest_fname_base, workers)
+            tile_gen = []
+        for tile_data, mask, profile, tb, i in tqdm(tile_gen):
+            nodata_perc = self._nodata_perc(tile_data, profile)
+            if self._over_nodata_threshold(nodata_perc, nodata_threshold):
+                continue
+            if block_order:
+                # tiles arrive out of order, ids are given once all are saved
+                tmp_path = self.save_tile(
+                    tile_data, mask, profile, 'tmp{}'.format(i), dest_fname_base)
+                unordered.append([i, tmp_path, tb, profile, nodata_perc])
+                continue
+            dest_path = self.save_tile(
+                tile_data, mask, profile, tile_id, dest_fname_base)
+            if nodata_threshold is not None:
+                self.save_scheme(
+                    tb, profile, tile_id, dest_fname_base
+                )
+                new_tile_bounds.append(tb)
+            self.tile_paths.append(dest_path)
+            self.tile_nodata.append(nodata_perc)
+            tile_id += 1
+        for i, tmp_path, tb, profile, nodata_perc in sorted(unordered, key=lambda x: x[0]):
+            dest_path = self.get_tile_path(profile, tile_id, dest_fname_base)
+            os.replace(tmp_path, dest_path)
+            if nodata_threshold is not None:
+                self.save_scheme(
+                    tb, profile, tile_id, dest_fname_base
+                )
+                new_tile_bounds.append(tb)
+            self.tile_paths.append(dest_path)
+            self.tile_nodata.append(nodata_perc)
+            tile_id += 1
+        if nodata_threshold is not None:
             self.tile_bounds = new_tile_bounds # only keep the tile bounds that make it past the nodata threshold
-        else:
-            for tile_data, mask, profile, tb in tqdm(tile_gen):
-                dest_path = self.save_tile(
-                    tile_data, mask, profile, tile_id, dest_fname_base)
-                self.tile_paths.append(dest_path)
-                tile_id += 1
+        if self.block_cache is not None and self.verbose:
+            print('block cache: {} hits, {} misses, {} bytes decoded'.format(
+                self.block_cache.hits, self.block_cache.misses,
+                self.block_cache.bytes_decoded))
 
         if self.verbose:
             print('Tiling complete. Cleaning up...')
@@ -228,11 +305,93 @@ class RasterTiler(object):
             os.remove(restricted_im_path)
         if self.verbose:
             print("Done. CRS returned for vector tiling.")
-        return _check_crs(profile['crs'])  # returns the crs to be used for vector tiling
+        return _check_crs(self.dest_crs)  # returns the crs to be used for vector tiling
+
+    def _nodata_perc(self, tile_data, profile):
+        """Fraction of a tile's pixels that are nodata."""
+        if profile['nodata'] is None:
+            return 0.
+        if np.isnan(profile['nodata']):
+            nodata_count = np.count_nonzero(np.isnan(tile_data[0]))
+        else:
+            nodata_count = np.logical_or.reduce((tile_data == profile['nodata']), axis=0).sum()
+        return nodata_count / (tile_data.shape[1] * tile_data.shape[2])
+
+    def _over_nodata_threshold(self, nodata_perc, nodata_threshold):
+        """Whether a tile has too much nodata to be saved."""
+        if nodata_threshold is None:
+            return False
+        if nodata_perc >= nodata_threshold:
+            if self.verbose==2:
+                print("{} of nodata is over the nodata_threshold, tile not saved.".format(nodata_perc))
+            return True
+        return False
+
+    def _tile_parallel(self, src, channel_idxs, nodata, alpha,
+                       nodata_threshold, screen_factor, screen_margin,
+                       block_order, cache_bytes, dest_fname_base, workers):
+        """Make and save tiles on a thread pool for :meth:`tile`.
+
+        Rasterio releases the GIL while decoding, warping and encoding, so
+        threads overlap the I/O and compute of different tiles. The read
+        order is cut into contiguous chunks (keeping the block locality of
+        `block_order`), and every thread opens its own handle on the source.
+        Tiles are saved under temporary names; returns
+        ``[index, tmp_path, tb, profile, nodata_perc]`` of the saved tiles.
+        """
+        channel_idxs, windows, order = self._prepare_tiles(
+            src, channel_idxs, nodata, alpha, nodata_threshold,
+            screen_factor, screen_margin, block_order)
+        local = threading.local()
+        handles = []
+        lock = threading.Lock()
+
+        def _run_chunk(chunk):
+            if not hasattr(local, 'src'):
+                local.src = rasterio.open(self.src.name)
+                local.cache = BlockCache(local.src, cache_bytes // workers) \
+                    if cache_bytes else None
+                with lock:
+                    handles.append((local.src, local.cache))
+            saved = []
+            for i in chunk:
+                tb = self.tile_bounds[i]
+                tile_data, mask, profile = self._make_tile(
+                    local.src, windows[i], tb, channel_idxs, nodata,
+                    local.cache)
+                nodata_perc = self._nodata_perc(tile_data, profile)
+                if self._over_nodata_threshold(nodata_perc, nodata_threshold):
+                    continue
+                tmp_path = self.save_tile(
+                    tile_data, mask, profile, 'tmp{}'.format(i),
+                    dest_fname_base)
+                saved.append([i, tmp_path, tb, profile, nodata_perc])
+            return saved
+
+        n_chunks = min(len(order), workers * 4)
+        bounds = np.linspace(0, len(order), n_chunks + 1).astype(int)
+        chunks = [order[b0:b1] for b0, b1 in zip(bounds[:-1], bounds[1:])]
+        unordered = []
+        try:
+            with ThreadPoolExecutor(workers) as executor:
+                for saved in tqdm(executor.map(_run_chunk, chunks),
+                                  total=len(chunks)):
+                    unordered.extend(saved)
+        finally:
+            for handle, cache in handles:
+                handle.close()
+        caches = [cache for _, cache in handles if cache is not None]
+        if caches and self.verbose:
+            print('block cache: {} hits, {} misses, {} bytes decoded'.format(
+                sum(c.hits for c in caches), sum(c.misses for c in caches),
+                sum(c.bytes_decoded for c in caches)))
+        return unordered
 
     def tile_generator(self, src, dest_dir=None, channel_idxs=None,
                        nodata=None, alpha=None, aoi_boundary=None,
-                       restrict_to_aoi=False):
+                       restrict_to_aoi=False, nodata_threshold=None,
+                       screen_factor=None, screen_margin=None,
+                       block_order=False, return_index=False):
         """Create the tiled output imagery from input tiles.
 
         Uses the arguments provided at initialization to generate output tiles.
@@ -272,6 +431,15 @@ class RasterTiler(object):
             AOI will not be returned. This is the inverse of the ``boundless``
             argument for :class:`rasterio.io.DatasetReader` 's ``.read()``
             method.
+        nodata_threshold, screen_factor, screen_margin : optional
+            If all are given, tiles whose estimated nodata percentage (see
+            :meth:`estimate_nodata`) exceeds ``nodata_threshold + screen_margin``
+            are skipped without being read.
+        block_order : bool, optional
+            Yield tiles row-major by source block instead of in
+            `tile_bounds` order.
+        return_index : bool, optional
+            Also yield each tile's index in `tile_bounds`.
 
         Yields
         ------
@@ -282,6 +450,29 @@ class RasterTiler(object):
             stored as an attribute of the :class:`Tiler` instance named
             `tile_bounds`.
 
+        """
+        channel_idxs, windows, order = self._prepare_tiles(
+            src, channel_idxs, nodata, alpha, nodata_threshold,
+            screen_factor, screen_margin, block_order)
+        for i in order:
+            tb = self.tile_bounds[i]
+            if self.verbose == 2:
+                print(f'tiling {i} out of {len(self.tile_bounds)}')
+            tile_data, mask, profile = self._make_tile(
+                self.src, windows[i], tb, channel_idxs, nodata,
+                getattr(self, 'block_cache', None))
+            if return_index:
+                yield tile_data, mask, profile, tb, i
+            else:
+                yield tile_data, mask, profile, tb
+
+    def _prepare_tiles(self, src, channel_idxs=None, nodata=None, alpha=None,
+                       nodata_threshold=None, screen_factor=None,
+                       screen_margin=None, block_order=False):
+        """Set up ``self.src`` for :meth:`tile_generator`.
+
+        Returns the channel indices, the source window of each tile in
+        `tile_bounds` and the indices of the tiles to read, in read order.
         """
         # parse arguments
         if self.verbose:
@@ -339,96 +530,193 @@ class RasterTiler(object):
             self.get_tile_bounds()
             print(f'tiling {len(self.tile_bounds)} tiles')
 
-        for i,tb in enumerate(self.tile_bounds):
-            # removing the following line until COG functionality implemented
-            if True:  # not self.is_cog or self.force_load_cog:
-                window = rasterio.windows.from_bounds(
-                    *tb, transform=self.src.transform,
-                    width=self.src_tile_size[1],
-                    height=self.src_tile_size[0])
-                if self.verbose == 2:
-                    print(f'tiling {i} out of {len(self.tile_bounds)}')
-                # print('reading data from window')
-                # print(self.nodata)
-                if self.src.count != 1:
-                    src_data = self.src.read(
-                        window=window,
-                        indexes=channel_idxs,
-                        boundless=True,
-                        fill_value=self.nodata)
-                else:
-                    src_data = self.src.read(
-                        window=window,
-                        boundless=True,
-                        fill_value=self.nodata)
-
-                dst_transform, width, height = calculate_default_transform(
-                    self.src.crs, self.dest_crs,
-                    self.src.width, self.src.height, *tb,
-                    dst_height=self.dest_tile_size[0],
-                    dst_width=self.dest_tile_size[1])
-
-                if self.dest_crs != self.src_crs and self.resampling_method is not None:
-                    tile_data = np.zeros(shape=(src_data.shape[0], height, width), dtype=src_data.dtype)
-                    rasterio.warp.reproject(
-                        source=src_data,
-                        destination=tile_data,
-                        src_transform=self.src.window_transform(window),
-                        src_crs=self.src.crs,
-                        dst_transform=dst_transform,
-                        dst_crs=self.dest_crs,
-                        dst_nodata=self.nodata,
-                        resampling=getattr(Resampling, self.resampling))
-
-                elif self.dest_crs != self.src_crs and self.resampling_method is None:
-                    print("Warning: You've set resampling to None but your "
-                          "destination projection differs from the source "
-                          "projection. Using bilinear resampling by default.")
-                    tile_data = np.zeros(shape=(src_data.shape[0], height, width),
-                                         dtype=src_data.dtype)
-                    tile_data = np.zeros(shape=(src_data.shape[0], height, width), dtype=src_data.dtype)
-                    rasterio.warp.reproject(
-                        source=src_data,
-                        destination=tile_data,
-                        src_transform=self.src.window_transform(window),
-                        src_crs=self.src.crs,
-                        dst_transform=dst_transform,
-                        dst_crs=self.dest_crs,
-                        dst_nodata=self.nodata,
-                        resampling=getattr(Resampling, "bilinear"))
-
-                else:  # for the case where there is no resampling and no dest_crs specified, no need to reproject or resample
-
-                    tile_data = src_data
-
-                if self.nodata:
-                    mask = np.all(tile_data != nodata,
-                                  axis=0).astype(np.uint8) * 255
-                elif self.alpha:
-                    mask = self.src.read(self.alpha, window=window)
-                else:
-                    mask = None  # placeholder
-
-            # else:
-            #     tile_data, mask, window, aff_xform = read_cog_tile(
-            #         src=self.src,
-            #         bounds=tb,
-            #         tile_size=self.dest_tile_size,
-            #         indexes=channel_idxs,
-            #         nodata=self.nodata,
-            #         resampling_method=self.resampling
-            #         )
-            profile = self.src.profile
-            profile.update(width=self.dest_tile_size[1],
-                           height=self.dest_tile_size[0],
-                           crs=self.dest_crs,
-                           transform=dst_transform)
-            if len(tile_data.shape) == 2:  # if there's no channel band
-                profile.update(count=1)
+        if screen_factor:
+            if screen_margin is None:
+                screen_margin = 4 * screen_factor / min(self.src_tile_size)
+            nodata_est = self.estimate_nodata(self.tile_bounds, screen_factor,
+                                              channel_idxs)
+            skip = nodata_est > nodata_threshold + screen_margin
+            if self.verbose:
+                print(f'screening skips {skip.sum()} of {len(skip)} tiles')
+        else:
+            skip = np.zeros(len(self.tile_bounds), dtype=bool)
+
+        windows = [rasterio.windows.from_bounds(
+                       *tb, transform=self.src.transform,
+                       width=self.src_tile_size[1],
+                       height=self.src_tile_size[0])
+                   for tb in self.tile_bounds]
+        order = [i for i in range(len(self.tile_bounds)) if not skip[i]]
+        if block_order:
+            if getattr(self, 'block_cache', None) is not None:
+                block_h, block_w = self.block_cache.block_shape
             else:
-                profile.update(count=tile_data.shape[0])
+                block_h, block_w = self.src.block_shapes[0]
+            order = sorted(order, key=lambda i: (
+                int(np.floor(windows[i].row_off + .5)) // block_h,
+                int(np.floor(windows[i].col_off + .5)) // block_w))
+
+        return channel_idxs, windows, order
+
+    def _make_tile(self, src, window, tb, channel_idxs, nodata=None,
+                   block_cache=None):
+        """Read (and reproject) the tile at `window` of `src`.
+
+        `src` is ``self.src`` or another handle on the same dataset.
+        """
+        # removing the following line until COG functionality implemented
+        if True:  # not self.is_cog or self.force_load_cog:
+            # print('reading data from window')
+            # print(self.nodata)
+            src_data = None
+            if block_cache is not None:
+                # None if the window is not fully inside the source
+                src_data = block_cache.read(window, channel_idxs)
+            if src_data is not None:
+                pass
+            elif src.count != 1:
+                src_data = src.read(
+                    window=window,
+                    indexes=channel_idxs,
+                    boundless=True,
+                    fill_value=self.nodata)
+            else:
+                src_data = src.read(
+                    window=window,
+                    boundless=True,
+                    fill_value=self.nodata)
+
+            dst_transform, width, height = calculate_default_transform(
+                src.crs, self.dest_crs,
+                src.width, src.height, *tb,
+                dst_height=self.dest_tile_size[0],
+                dst_width=self.dest_tile_size[1])
+
+            if self.dest_crs != self.src_crs and self.resampling_method is not None:
+                tile_data = np.zeros(shape=(src_data.shape[0], height, width), dtype=src_data.dtype)
+                rasterio.warp.reproject(
+                    source=src_data,
+                    destination=tile_data,
+                    src_transform=src.window_transform(window),
+                    src_crs=src.crs,
+                    dst_transform=dst_transform,
+                    dst_crs=self.dest_crs,
+                    dst_nodata=self.nodata,
+                    resampling=getattr(Resampling, self.resampling))
+
+            elif self.dest_crs != self.src_crs and self.resampling_method is None:
+                print("Warning: You've set resampling to None but your "
+                      "destination projection differs from the source "
+                      "projection. Using bilinear resampling by default.")
+                tile_data = np.zeros(shape=(src_data.shape[0], height, width),
+                                     dtype=src_data.dtype)
+                tile_data = np.zeros(shape=(src_data.shape[0], height, width), dtype=src_data.dtype)
+                rasterio.warp.reproject(
+                    source=src_data,
+                    destination=tile_data,
+                    src_transform=src.window_transform(window),
+                    src_crs=src.crs,
+                    dst_transform=dst_transform,
+                    dst_crs=self.dest_crs,
+                    dst_nodata=self.nodata,
+                    resampling=getattr(Resampling, "bilinear"))
+
+            else:  # for the case where there is no resampling and no dest_crs specified, no need to reproject or resample
+
+                tile_data = src_data
+
+            if self.nodata:
+                mask = np.all(tile_data != nodata,
+                              axis=0).astype(np.uint8) * 255
+            elif self.alpha:
+                mask = src.read(self.alpha, window=window)
+            else:
+                mask = None  # placeholder
+
+        # else:
+        #     tile_data, mask, window, aff_xform = read_cog_tile(
+        #         src=self.src,
+        #         bounds=tb,
+        #         tile_size=self.dest_tile_size,
+        #         indexes=channel_idxs,
+        #         nodata=self.nodata,
+        #         resampling_method=self.resampling
+        #         )
+        profile = src.profile
+        if profile['driver'] == 'VRT':
+            # e.g. a warped VRT from sar.Orthorectify, save tiles as GTiff
+            for key in ('blockxsize', 'blockysize', 'tiled'):
+                profile.pop(key, None)
+            profile.update(driver='GTiff')
+        profile.update(width=self.dest_tile_size[1],
+                       height=self.dest_tile_size[0],
+                       crs=self.dest_crs,
+                       transform=dst_transform)
+        if len(tile_data.shape) == 2:  # if there's no channel band
+            profile.update(count=1)
+        else:
+            profile.update(count=tile_data.shape[0])
+
+        return tile_data, mask, profile
+
+    def estimate_nodata(self, tile_bounds, factor, channel_idxs=None):
+        """Estimate the nodata fraction of each tile from a downsampled mask.
+
+        The valid-data mask of ``self.src`` is read once at ``1/factor`` of
+        its resolution (using overviews if present) and averaged, then each
+        tile's nodata fraction is summed from its integral image. Pixels
+        outside the source bounds count as nodata, like boundless reads.
+        As in :meth:`tile`, only the first band is used when nodata is NaN,
+        otherwise a pixel is nodata if any band is.
+
+        Arguments
+        ---------
+        tile_bounds : list
+            ``[left, bottom, right, top]`` bounds of each tile.
+        factor : int
+            Downsampling factor of the mask.
+        channel_idxs : list, optional
+            Bands to use, starting at ``1``. Defaults to all bands.
 
-            yield tile_data, mask, profile, tb
+        Returns
+        -------
+        nodata_est : :class:`numpy.ndarray`
+            Estimated nodata fraction of each tile.
+        """
+        if channel_idxs is None:
+            channel_idxs = list(range(1, self.src.count + 1))
+        if self.src.nodata is not None and np.isnan(self.src.nodata):
+            channel_idxs = channel_idxs[:1]
+        out_h = int(np.ceil(self.src.height / factor))
+        out_w = int(np.ceil(self.src.width / factor))
+        masks = self.src.read_masks(channel_idxs,
+                                    out_shape=(len(channel_idxs), out_h, out_w),
+                                    resampling=Resampling.average)
+        invalid = 1. - masks.min(axis=0) / 255.
+        # integral image with a leading row and column of zeros
+        integral = np.zeros((out_h + 1, out_w + 1))
+        integral[1:, 1:] = invalid.cumsum(axis=0).cumsum(axis=1)
+
+        if len(tile_bounds) == 0:
+            return np.zeros(0)
+        tb = np.asarray(tile_bounds, dtype=np.float64)
+        inv = ~self.src.transform
+        col0, row0 = inv * (tb[:, 0], tb[:, 3])  # top left
+        col1, row1 = inv * (tb[:, 2], tb[:, 1])  # bottom right
+        col0, col1 = np.minimum(col0, col1), np.maximum(col0, col1)
+        row0, row1 = np.minimum(row0, row1), np.maximum(row0, row1)
+        scale_x = self.src.width / out_w
+        scale_y = self.src.height / out_h
+        c0 = np.clip(np.round(col0 / scale_x), 0, out_w).astype(int)
+        c1 = np.clip(np.round(col1 / scale_x), 0, out_w).astype(int)
+        r0 = np.clip(np.round(row0 / scale_y), 0, out_h).astype(int)
+        r1 = np.clip(np.round(row1 / scale_y), 0, out_h).astype(int)
+        inside_invalid = (integral[r1, c1] - integral[r0, c1]
+                          - integral[r1, c0] + integral[r0, c0])
+        inside_cells = (r1 - r0) * (c1 - c0)
+        total_cells = ((row1 - row0) / scale_y) * ((col1 - col0) / scale_x)
+        outside_cells = np.maximum(total_cells - inside_cells, 0)
+        return np.clip((inside_invalid + outside_cells) / total_cells, 0, 1)
 
     def save_scheme(self, tb, profile, i, dest_fname_base=None):
         # save tile_scheme to reconstruct tiling
@@ -438,6 +726,26 @@ class RasterTiler(object):
 
     def save_tile(self, tile_data, mask, profile, i, dest_fname_base=None):
         """Save a tile created by ``Tiler.tile_generator()``."""
+        dest_path = self.get_tile_path(profile, i, dest_fname_base)
+
+        with rasterio.open(dest_path, 'w',
+                           **profile) as dest:
+            if profile['count'] == 1:
+                dest.write(tile_data[0, :, :], 1)
+            else:
+                for band in range(1, profile['count'] + 1):
+                    # base-1 vs. base-0 indexing...bleh
+                    dest.write(tile_data[band-1, :, :], band)
+            if self.alpha:
+                # write the mask if there's an alpha band
+                dest.write(mask, profile['count'] + 1)
+
+            dest.close()
+
+        return dest_path
+
+    def get_tile_path(self, profile, i, dest_fname_base=None):
+        """Path that ``Tiler.save_tile()`` writes tile `i` to."""
         tile_id = str(i).zfill(4)  # give zero padding for easier sorting
         if dest_fname_base is None:
             dest_fname_root = os.path.splitext(
@@ -456,23 +764,7 @@ class RasterTiler(object):
         # if self.cog_output:
         #     dest_path = os.path.join(self.dest_dir, 'tmp.tif')
         # else:
-        dest_path = os.path.join(self.dest_dir, dest_fname)
-
-        with rasterio.open(dest_path, 'w',
-                           **profile) as dest:
-            if profile['count'] == 1:
-                dest.write(tile_data[0, :, :], 1)
-            else:
-                for band in range(1, profile['count'] + 1):
-                    # base-1 vs. base-0 indexing...bleh
-                    dest.write(tile_data[band-1, :, :], band)
-            if self.alpha:
-                # write the mask if there's an alpha band
-                dest.write(mask, profile['count'] + 1)
-
-            dest.close()
-
-        return dest_path
+        return os.path.join(self.dest_dir, dest_fname)
 
         # if self.cog_output:
         #     self._create_cog(os.path.join(self.dest_dir, 'tmp.tif'),
@@ -540,8 +832,18 @@ class RasterTiler(object):
                 # split_geom can take a list
                 self.aoi_boundary = list(self.src.bounds)
 
-        self.tile_bounds = split_geom(geometry=self.aoi_boundary, tile_size=self.src_tile_size, resolution=(
-            self.src.transform[0], -self.src.transform[4]), use_projection_units=self.use_src_metric_size, src_img=self.src, stride=self.stride)
+        if self.min_coverage:
+            tile_bounds, coverage = split_geom(geometry=self.aoi_boundary, tile_size=self.src_tile_size, resolution=(
+                self.src.transform[0], -self.src.transform[4]), use_projection_units=self.use_src_metric_size, src_img=self.src, stride=self.stride,
+                return_coverage=True)
+            self.tile_bounds = [tb for tb, cov in zip(tile_bounds, coverage)
+                                if cov >= self.min_coverage]
+        else:
+            self.tile_bounds = split_geom(geometry=self.aoi_boundary, tile_size=self.src_tile_size, resolution=(
+                self.src.transform[0], -self.src.transform[4]), use_projection_units=self.use_src_metric_size, src_img=self.src, stride=self.stride)
+        if self.snap_to_grid and len(self.tile_bounds):
+            self.tile_bounds = [tuple(tb) for tb in
+                                snap_bounds(self.tile_bounds, self.src.transform)]
 
     def load_src_vrt(self):
         """Load a source dataset's VRT into the destination CRS."""
@@ -549,3 +851,101 @@ class RasterTiler(object):
                           resampling=getattr(Resampling, self.resampling),
                           src_nodata=self.nodata, dst_nodata=self.nodata)
         return WarpedVRT(self.src, **vrt_params)
+
+
+class BlockCache(object):
+    """An LRU cache of decoded source blocks for :class:`RasterTiler`.
+
+    Blocks are keyed by ``(band, block row, block col)``. A cache block is
+    the dataset's internal block, grown to a multiple of it of at least
+    `min_block` pixels per side (so striped GeoTIFFs aren't read one row at a
+    time). Least recently used blocks are dropped once the cache holds more
+    than `max_bytes`.
+
+    Arguments
+    ---------
+    src : :class:`rasterio.io.DatasetReader`
+        The source dataset.
+    max_bytes : int, optional
+        Memory cap of the cached blocks. Defaults to 512 MB.
+    min_block : int, optional
+        Minimum cache block size in pixels. Defaults to ``256``.
+
+    Attributes
+    ----------
+    hits : int
+        Blocks served from the cache.
+    misses : int
+        Blocks that had to be read and decoded.
+    bytes_decoded : int
+        Bytes read from `src` on misses.
+    """
+
+    def __init__(self, src, max_bytes=512*2**20, min_block=256):
+        self.src = src
+        self.max_bytes = max_bytes
+        native_h, native_w = src.block_shapes[0]
+        self.block_shape = (
+            min(native_h * int(np.ceil(min_block / native_h)), src.height),
+            min(native_w * int(np.ceil(min_block / native_w)), src.width))
+        self.blocks = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_decoded = 0
+
+    def get_block(self, band, block_row, block_col):
+        """Return the decoded block, reading it from `src` on a miss."""
+        key = (band, block_row, block_col)
+        if key in self.blocks:
+            self.hits += 1
+            self.blocks.move_to_end(key)
+            return self.blocks[key]
+        self.misses += 1
+        block_h, block_w = self.block_shape
+        window = rasterio.windows.Window(
+            block_col * block_w, block_row * block_h,
+            min(block_w, self.src.width - block_col * block_w),
+            min(block_h, self.src.height - block_row * block_h))
+        data = self.src.read(band, window=window)
+        self.bytes_decoded += data.nbytes
+        self.blocks[key] = data
+        self.nbytes += data.nbytes
+        while self.nbytes > self.max_bytes and len(self.blocks) > 1:
+            _, old = self.blocks.popitem(last=False)
+            self.nbytes -= old.nbytes
+        return data
+
+    def read(self, window, indexes):
+        """Assemble a window from cached blocks.
+
+        Window offsets and sizes are rounded half up, as rasterio does for
+        reads. Returns ``None`` if the window is not fully inside `src`
+        (boundless reads are left to rasterio).
+        """
+        row0 = int(np.floor(window.row_off + .5))
+        col0 = int(np.floor(window.col_off + .5))
+        height = int(np.floor(window.height + .5))
+        width = int(np.floor(window.width + .5))
+        if row0 < 0 or col0 < 0 or row0 + height > self.src.height \
+           or col0 + width > self.src.width:
+            return None
+        if isinstance(indexes, int):
+            indexes = [indexes]
+        block_h, block_w = self.block_shape
+        out = np.empty((len(indexes), height, width),
+                       dtype=self.src.dtypes[indexes[0] - 1])
+        for b, band in enumerate(indexes):
+            for block_row in range(row0 // block_h,
+                                   (row0 + height - 1) // block_h + 1):
+                r0 = max(row0, block_row * block_h)
+                r1 = min(row0 + height, (block_row + 1) * block_h)
+                for block_col in range(col0 // block_w,
+                                       (col0 + width - 1) // block_w + 1):
+                    c0 = max(col0, block_col * block_w)
+                    c1 = min(col0 + width, (block_col + 1) * block_w)
+                    block = self.get_block(band, block_row, block_col)
+                    out[b, r0 - row0:r1 - row0, c0 - col0:c1 - col0] = \
+                        block[r0 - block_row * block_h:r1 - block_row * block_h,
+                              c0 - block_col * block_w:c1 - block_col * block_w]
+        return out
@@ -1,13 +1,15 @@
 from osgeo import gdal
+from osgeo import gdal_array  # for in-memory orthorectify
 import os
 import numpy as np
 
 import scipy.signal
 import math  # for nan
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import json  # for capella scale factor
-from .pipesegment import PipeSegment
+from .pipesegment import PipeSegment, LoadSegment
 from .image import Image
 from . import image
 
@@ -35,31 +37,163 @@ class Intensity(PipeSegment):
         return pout
 
 
+def _multilook_filter(method):
+    if method == 'avg':
+        return scipy.ndimage.filters.uniform_filter
+    elif method == 'med':
+        return scipy.ndimage.filters.median_filter
+    elif method == 'max':
+        return scipy.ndimage.filters.maximum_filter
+    else:
+        raise Exception('! Invalid method in Multilook.')
+
+
+def _histogram_levels(data):
+    """
+    Return the minimum and number of levels if 'data' is quantised
+    (integer-valued, no NaNs) with at most 256 levels, otherwise None.
+    """
+    if data.size == 0:
+        return None
+    if np.issubdtype(data.dtype, np.floating):
+        if not np.all(np.isfinite(data)) or \
+           not np.array_equal(data, np.floor(data)):
+            return None
+    elif not np.issubdtype(data.dtype, np.integer):
+        return None
+    low = data.min()
+    nlevels = int(data.max() - low) + 1
+    if nlevels > 256:
+        return None
+    return low, nlevels
+
+
+# measured cost per pixel (1000x1000 band, scipy 1.x): one float32 box filter
+# pass of histogram_median_filter ~9 ns, median_filter ~20 ns per window
+# element (less for 2x2), so the histogram breaks even at a window area of
+# about (nlevels - 1) / 2. it is only used above 1.5x that, where the gain is
+# clear and the extra memory pays off
+_HISTOGRAM_MEDIAN_RATIO = 1.5
+
+
+def _use_histogram_median(data, size):
+    """
+    Whether histogram_median_filter is expected to beat
+    scipy.ndimage.median_filter on 'data': quantised (see
+    _histogram_levels) and a window area over
+    _HISTOGRAM_MEDIAN_RATIO times the number of box passes.  Both costs
+    grow linearly with the number of pixels, so only the kernel size and
+    the number of levels decide; for the multilook sizes (2-8) of 8-bit
+    data it stays on median_filter.
+    """
+    area = int(np.prod(np.broadcast_to(size, (data.ndim,))))
+    levels = _histogram_levels(data)
+    return levels is not None and \
+        levels[1] - 1 < area / _HISTOGRAM_MEDIAN_RATIO
+
+
+def histogram_median_filter(data, size, mode='reflect', output=None):
+    """
+    Median filter for quantised data (at most 256 levels, see
+    _histogram_levels), using a box count per level instead of sorting
+    each window.  The result matches scipy.ndimage.median_filter.
+
+    Cost model: nlevels - 1 uniform_filter passes over the band, so
+    time ~ pixels * (nlevels - 1) and independent of the kernel size,
+    against pixels * kernel area for median_filter; extra memory is 9
+    bytes per pixel (two float32 planes and a uint8 counter).  Only
+    faster for large kernels or few levels, _multilook picks it through
+    _use_histogram_median.
+    """
+    low, nlevels = _histogram_levels(data)
+    size = np.broadcast_to(size, (data.ndim,))
+    rank = int(np.prod(size)) // 2
+    # box filter gives the fraction of the window at or below each level,
+    # rank_frac sits half a count between two fractions so float32 is exact enough
+    rank_frac = (rank + .5) / np.prod(size)
+    levels = data - low
+    below = np.empty(data.shape, dtype=np.float32)
+    window = np.empty(data.shape, dtype=np.float32)
+    median = np.zeros(data.shape, dtype=np.uint8)
+    for level in range(nlevels - 1):
+        np.less_equal(levels, level, out=below)
+        scipy.ndimage.filters.uniform_filter(below, size=size, mode=mode,
+                                             output=window)
+        median += window < rank_frac
+    if output is None:
+        output = np.empty(data.shape, dtype=data.dtype)
+    np.add(median, low, out=output, casting='unsafe')
+    return output
+
+
+def _filter_rows(filter, data, out, kernel_size, row0, row1):
+    """
+    Filter rows row0:row1 of a single band, reading a halo of rows
+    either side so the result matches filtering the whole band.
+    """
+    halo = int(np.max(kernel_size))
+    read0 = max(row0 - halo, 0)
+    read1 = min(row1 + halo, data.shape[0])
+    out[row0:row1, :] = filter(
+        data[read0:read1, :],
+        size=kernel_size,
+        mode='reflect')[row0 - read0:row1 - read0, :]
+
+
+def _multilook(data, out, kernel_size, method, workers=1, tile_rows=None):
+    """
+    Apply the multilook filter to each band of 'data' into 'out'.
+    With workers > 1, bands and row tiles within each band run on a
+    thread pool (the scipy filters release the GIL).
+    """
+    filters = []
+    for i in range(data.shape[0]):
+        if method == 'med' and _use_histogram_median(data[i], kernel_size):
+            filters.append(histogram_median_filter)
+        else:
+            filters.append(_multilook_filter(method))
+    if workers == 1 and tile_rows is None:
+        for i in range(data.shape[0]):
+            out[i, :, :] = filters[i](
+                data[i, :, :],
+                size=kernel_size,
+                mode='reflect')
+        return out
+
+    nrows = data.shape[1]
+    if tile_rows is None:
+        tiles_per_band = int(np.ceil(workers / data.shape[0]))
+        tile_rows = int(np.ceil(nrows / tiles_per_band))
+    tasks = [(filters[i], data[i], out[i], kernel_size,
+              row0, min(row0 + tile_rows, nrows))
+             for i in range(data.shape[0])
+             for row0 in range(0, nrows, tile_rows)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_filter_rows, *task) for task in tasks]
+        for future in futures:
+            future.result()
+    return out
+
+
 class Multilook(PipeSegment):
     """
     Multilook filter to reduce speckle in SAR magnitude imagery
     Note: Set kernel_size to a tuple to vary it by direction.
+    Set workers > 1 to filter bands, and row tiles of 'tile_rows' rows
+    within each band, on a thread pool.  The 'med' method uses a
+    histogram-based median for quantised (e.g. uint8) bands.
     """
-    def __init__(self, kernel_size=5, method='avg'):
+    def __init__(self, kernel_size=5, method='avg', workers=1, tile_rows=None):
         super().__init__()
         self.kernel_size = kernel_size
         self.method = method
+        self.workers = workers
+        self.tile_rows = tile_rows
     def transform(self, pin):
-        if self.method == 'avg':
-            filter = scipy.ndimage.filters.uniform_filter
-        elif self.method == 'med':
-            filter = scipy.ndimage.filters.median_filter
-        elif self.method == 'max':
-            filter = scipy.ndimage.filters.maximum_filter
-        else:
-            raise Exception('! Invalid method in Multilook.')
         pout = Image(np.zeros(pin.data.shape, dtype=pin.data.dtype),
                      pin.name, pin.metadata)
-        for i in range(pin.data.shape[0]):
-            pout.data[i, :, :] = filter(
-                pin.data[i, :, :],
-                size=self.kernel_size,
-                mode='reflect')
+        _multilook(pin.data, pout.data, self.kernel_size, self.method,
+                   self.workers, self.tile_rows)
         return pout
 
 
@@ -89,32 +223,270 @@ class Decibels(PipeSegment):
         return pout
 
 
+class CalibratedMultilookDb(PipeSegment):
+    """
+    Fused equivalent of CapellaScaleFactor, MergeToStack, Intensity,
+    Multilook and Decibels, giving the same numerical results.
+    Takes an Image or a tuple of Images (e.g. the sum of LoadImage segments)
+    and works band by band in two reused band buffers, so the only
+    full-size allocation is the output stack.
+    Set 'calibrate' to False to skip the Capella scale factor.
+    """
+    def __init__(self, kernel_size=5, method='avg', flag='min',
+                 calibrate=True, master=0, workers=1, tile_rows=None):
+        super().__init__()
+        self.kernel_size = kernel_size
+        self.method = method
+        self.flag = flag
+        self.calibrate = calibrate
+        self.master = master
+        self.workers = workers
+        self.tile_rows = tile_rows
+    def transform(self, pin):
+        if not isinstance(pin, tuple):
+            pin = (pin,)
+        _multilook_filter(self.method)  # validate method before loading
+        bands = []
+        for imageobj in pin:
+            if self.calibrate:
+                tiffjson = json.loads(
+                    imageobj.metadata['meta']['TIFFTAG_IMAGEDESCRIPTION'])
+                scale_factor = tiffjson['collect']['image']['scale_factor']
+            else:
+                scale_factor = 1
+            for i in range(imageobj.data.shape[0]):
+                bands.append((imageobj.data[i], scale_factor))
+
+        # Preallocate output and the reused band buffers
+        shape = bands[0][0].shape
+        scaled_dtype = np.result_type(bands[0][0].dtype, bands[0][1])
+        intensity_dtype = np.empty(0, dtype=scaled_dtype).real.dtype
+        outdata = np.empty((len(bands),) + shape, dtype=intensity_dtype)
+        scaled = np.empty(shape, dtype=scaled_dtype)
+        intensity = np.empty(shape, dtype=intensity_dtype)
+        positive = np.empty(shape, dtype=bool)
+
+        # Calibrated intensity and multilook
+        posmin = math.inf
+        for i, (band, scale_factor) in enumerate(bands):
+            np.multiply(band, scale_factor, out=scaled)
+            if np.iscomplexobj(scaled):
+                np.absolute(scaled, out=intensity)
+                np.square(intensity, out=intensity)
+            else:
+                np.square(scaled, out=intensity)
+            _multilook(intensity[np.newaxis], outdata[i:i+1],
+                       self.kernel_size, self.method,
+                       self.workers, self.tile_rows)
+            np.greater(outdata[i], 0, out=positive)
+            posmin = min(posmin, np.min(outdata[i], where=positive,
+                                        initial=math.inf))
+
+        # Decibels, in place
+        if isinstance(self.flag, str) and self.flag.lower() == 'min':
+            flagval = 10. * np.log10(posmin)
+        elif isinstance(self.flag, str) and self.flag.lower() == 'nan':
+            flagval = math.nan
+        else:
+            flagval = self.flag / 10.
+        flagval = outdata.dtype.type(flagval)
+        for i in range(outdata.shape[0]):
+            np.greater(outdata[i], 0, out=positive)
+            np.log10(outdata[i], out=outdata[i], where=positive)
+            np.logical_not(positive, out=positive)
+            np.copyto(outdata[i], flagval, where=positive)
+            np.multiply(outdata[i], 10., out=outdata[i])
+        return Image(outdata, pin[self.master].name, pin[self.master].metadata)
+
+
+class BlockRadiometry(LoadSegment):
+    """
+    Block-streaming equivalent of loading each SLC file, then running
+    CapellaScaleFactor, MergeToStack, Intensity, Multilook and Decibels.
+    Each file is read in overlapping row strips (with a halo equal to the
+    multilook kernel), and the result is written to a GeoTIFF at 'dstpath',
+    so peak memory is bounded by 'block_rows' instead of the stripe size.
+    If 'block_rows' is None, each band is processed in a single block.
+    Returns 'dstpath', which can be piped into Orthorectify.
+    """
+    def __init__(self, pathstrings, dstpath, kernel_size=5, method='avg',
+                 flag='min', block_rows=2048, master=0):
+        super().__init__()
+        self.pathstrings = pathstrings
+        self.dstpath = dstpath
+        self.kernel_size = kernel_size
+        self.method = method
+        self.flag = flag
+        self.block_rows = block_rows
+        self.master = master
+    def load(self):
+        datasets = [gdal.Open(p) for p in self.pathstrings]
+        for p, dataset in zip(self.pathstrings, datasets):
+            if dataset is None:
+                raise Exception('! Image file ' + p + ' not found.')
+        ncols = datasets[0].RasterXSize
+        nrows = datasets[0].RasterYSize
+        nbands = sum(dataset.RasterCount for dataset in datasets)
+        halo = np.max(self.kernel_size)
+        block_rows = self.block_rows or nrows
+
+        # Output takes its georeferencing from the master, like MergeToStack
+        master = datasets[self.master]
+        driver = gdal.GetDriverByName('GTiff')
+        dst = driver.Create(self.dstpath, ncols, nrows, nbands,
+                            gdal.GDT_Float32, ['BIGTIFF=IF_SAFER'])
+        if len(master.GetProjectionRef()) > 0:
+            dst.SetGeoTransform(master.GetGeoTransform())
+            dst.SetProjection(master.GetProjectionRef())
+        else:
+            dst.SetGCPs(master.GetGCPs(), master.GetGCPProjection())
+        dst.SetMetadata(master.GetMetadata())
+
+        # First pass: calibrated, multilooked intensity
+        posmin = math.inf
+        band_out = 0
+        for dataset in datasets:
+            metadata = {'meta': dataset.GetMetadata()}
+            for band in range(1, dataset.RasterCount+1):
+                bandptr = dataset.GetRasterBand(band)
+                band_out += 1
+                for row0 in range(0, nrows, block_rows):
+                    row1 = min(row0 + block_rows, nrows)
+                    read0 = max(row0 - halo, 0)
+                    read1 = min(row1 + halo, nrows)
+                    strip = Image(
+                        bandptr.ReadAsArray(0, read0, ncols, read1 - read0),
+                        metadata=metadata)
+                    strip = (strip * CapellaScaleFactor() * Intensity()
+                             * Multilook(self.kernel_size, self.method))()
+                    block = strip.data[0, row0 - read0:row1 - read0, :]
+                    if np.any(block > 0):
+                        posmin = min(posmin, block[block > 0].min())
+                    dst.GetRasterBand(band_out).WriteArray(block, 0, row0)
+        datasets = None
+
+        # Second pass: decibels, with the flag computed over the whole stack
+        if isinstance(self.flag, str) and self.flag.lower() == 'min':
+            flagval = 10. * np.log10(posmin)
+        elif isinstance(self.flag, str) and self.flag.lower() == 'nan':
+            flagval = math.nan
+        else:
+            flagval = self.flag / 10.
+        for band in range(1, nbands+1):
+            bandptr = dst.GetRasterBand(band)
+            for row0 in range(0, nrows, block_rows):
+                nblock = min(block_rows, nrows - row0)
+                block = bandptr.ReadAsArray(0, row0, ncols, nblock)
+                block = 10. * np.log10(
+                    block,
+                    out=np.full(np.shape(block), flagval).astype(block.dtype),
+                    where=block>0
+                )
+                bandptr.WriteArray(block, 0, row0)
+            bandptr.FlushCache()
+        dst.FlushCache()
+        dst = None
+        return self.dstpath
+
+
 class Orthorectify(PipeSegment):
     """
     Orthorectify an image using its ground control points (GCPs) with GDAL
+    The piped input can be an Image or the path of a file on disk.
+    If 'dstpath' is given, the result is warped directly into that file
+    and its path is returned instead of an Image.
+    With 'in_memory', an Image input is wrapped (without copying) in a GDAL
+    MEM dataset and, unless 'dstpath' is given, warped into another MEM
+    dataset, avoiding the /vsimem GTiff round-trips.
+    'warp_memory' (working buffer in MB) and 'num_threads' (an int or
+    'ALL_CPUS') are passed on to gdal.Warp.
+    Set format='VRT' with a file input and 'dstpath' to write a warped VRT
+    instead: pixels are then only warped when windows of it are read.
     """
     def __init__(self, projection=3857, algorithm='lanczos',
-                 row_res=1., col_res=1.):
+                 row_res=1., col_res=1., dstpath=None, in_memory=False,
+                 warp_memory=None, num_threads=None, format=None):
         super().__init__()
+        self.format = format
         self.projection = projection
         self.algorithm = algorithm
         self.row_res = row_res
         self.col_res = col_res
+        self.dstpath = dstpath
+        self.in_memory = in_memory
+        self.warp_memory = warp_memory
+        self.num_threads = num_threads
     def transform(self, pin):
+        if isinstance(pin, str):
+            return self.warp(pin)
+        if self.in_memory:
+            return self.transform_in_memory(pin)
         drivername = 'GTiff'
         srcpath = '/vsimem/orthorectify_input_' + str(uuid.uuid4()) + '.tif'
-        dstpath = '/vsimem/orthorectify_output_' + str(uuid.uuid4()) + '.tif'
         (pin * image.SaveImage(srcpath, driver=drivername))()
-        gdal.Warp(dstpath, srcpath,
-                  dstSRS='epsg:' + str(self.projection),
-                  resampleAlg=self.algorithm,
-                  xRes=self.row_res, yRes=self.col_res,
-                  dstNodata=math.nan)
-        pout = image.LoadImage(dstpath)()
+        pout = self.warp(srcpath)
+        driver = gdal.GetDriverByName(drivername)
+        driver.Delete(srcpath)
+        if self.dstpath is not None:
+            return pout
         pout.name = pin.name
         if pin.data.dtype in (bool, np.dtype('bool')):
             pout.data = pout.data.astype('bool')
+        return pout
+    def transform_in_memory(self, pin):
+        data = pin.data
+        if data.dtype in (bool, np.dtype('bool')):
+            data = data.astype(np.uint8)
+        # MEM dataset pointing at the numpy buffer; 'data' must outlive it
+        src = gdal_array.OpenArray(data)
+        image.set_projection(src, pin.metadata)
+        if 'meta' in pin.metadata.keys():
+            src.SetMetadata(pin.metadata['meta'])
+        if self.dstpath is not None:
+            dst = self.warp(src)
+            src = None
+            return dst
+        dst = self.warp(src, format='MEM')
+        src = None
+        pout = image.LoadImageFromDisk(None).load_from_dataset(dst, pin.name)
+        dst = None
+        if pin.data.dtype in (bool, np.dtype('bool')):
+            pout.data = pout.data.astype('bool')
+        return pout
+    def warp(self, src, format=None):
+        """
+        Warp 'src' (a path or GDAL dataset).  Returns 'dstpath' if it was
+        given, the MEM dataset if format='MEM', and otherwise an Image.
+        """
+        drivername = 'GTiff'
+        if self.dstpath is not None:
+            dstpath = self.dstpath
+        elif format == 'MEM':
+            dstpath = ''
+        else:
+            dstpath = '/vsimem/orthorectify_output_' + str(uuid.uuid4()) + '.tif'
+        kwargs = {}
+        if format is None:
+            format = self.format
+        if format is not None:
+            kwargs['format'] = format
+        if self.warp_memory is not None:
+            kwargs['warpMemoryLimit'] = self.warp_memory
+        if self.num_threads is not None:
+            kwargs['multithread'] = True
+            kwargs['warpOptions'] = ['NUM_THREADS=' + str(self.num_threads)]
+        dst = gdal.Warp(dstpath, src,
+                        dstSRS='epsg:' + str(self.projection),
+                        resampleAlg=self.algorithm,
+                        xRes=self.row_res, yRes=self.col_res,
+                        dstNodata=math.nan, **kwargs)
+        if self.dstpath is not None:
+            dst = None
+            return dstpath
+        elif format == 'MEM':
+            return dst
+        dst = None
+        pout = image.LoadImage(dstpath)()
         driver = gdal.GetDriverByName(drivername)
-        driver.Delete(srcpath)
         driver.Delete(dstpath)
-        return pout
\ No newline at end of file
+        return pout
@@ -1,5 +1,6 @@
 import os
 import numpy as np
+import pandas as pd
 from shapely.geometry import box, Polygon
 import geopandas as gpd
 from .core import _check_gdf_load, _check_crs
@@ -9,11 +10,64 @@ from .geo import reproject_geometry
 from tqdm.auto import tqdm
 
 
+class LabelStore(object):
+    """Labels prepared once for clipping to many tiles.
+
+    Holds the label geometries as a vectorised geometry array along with
+    their original areas and lengths (also added to `gdf` as the
+    `origarea` and `origlen` columns) and the spatial index, so
+    :func:`clip_gdf` and :func:`bulk_clip_gdf` only subset the labels each
+    tile touches instead of copying and intersecting the whole frame.
+
+    Arguments
+    ---------
+    gdf : :py:class:`geopandas.GeoDataFrame`
+        The labels. `origarea` and `origlen` columns are added in place if
+        missing.
+    geom_type : str, optional
+        Type of objects in `gdf`. Can be one of
+        ``["Polygon", "LineString"]`` . Defaults to ``"Polygon"`` .
+
+    Attributes
+    ----------
+    geoms : :class:`geopandas.array.GeometryArray`
+        The geometries of `gdf`.
+    area, length : :class:`numpy.ndarray`
+        The `origarea` and `origlen` of each geometry.
+    """
+
+    def __init__(self, gdf, geom_type='Polygon'):
+        _add_orig_measures(gdf, geom_type)
+        self.gdf = gdf
+        self.crs = gdf.crs
+        self.geoms = gdf.geometry.values
+        self.area = gdf['origarea'].values
+        self.length = gdf['origlen'].values
+
+    def __len__(self):
+        return len(self.gdf)
+
+    @property
+    def sindex(self):
+        return self.gdf.sindex
+
+    def query(self, tile_poly):
+        """Sorted row positions of the labels intersecting `tile_poly`."""
+        return np.sort(self.sindex.query(tile_poly, predicate='intersects'))
+
+
 class VectorTiler(object):
     """An object to tile geospatial vector data into smaller pieces.
 
     Arguments
     ---------
+    output_format : str, optional
+        ``'GeoJSON'`` (default) writes a file per tile. ``'parquet'`` writes
+        all tiles of a :meth:`tile` call to one GeoParquet,
+        ``{dest_fname_base}.parquet``, with a `tile_id` column holding the
+        name each tile's GeoJSON would have had (without extension). Its
+        tiles are referred to as ``{dest_fname_base}.parquet/{tile_id}`` in
+        `tile_paths`; see :func:`read_vector_tile`.
 
 
     Attributes
@@ -39,7 +93,7 @@ class VectorTiler(object):
     def tile(self, src, tile_bounds, tile_bounds_crs=None, geom_type='Polygon',
              split_multi_geoms=True, min_partial_perc=0.0,
              dest_fname_base='geoms', obj_id_col=None,
-             output_ext='.geojson'):
+             output_ext='.geojson', bulk=False):
         """Tile `src` into vector data tiles bounded by `tile_bounds`.
 
         Arguments
@@ -82,6 +136,10 @@ class VectorTiler(object):
             :func:`solaris.utils.geo.split_multi_geometries` for more.
         output_ext : str, optional, (default: geojson)
             Extension of output files, can be 'geojson' or 'json'.
+        bulk : bool, optional (default: False)
+            Clip all tiles at once with :func:`bulk_clip_gdf` instead of
+            calling :func:`clip_gdf` per tile. Only used for Polygons; the
+            output is the same.
         """
 
         if isinstance(src, gpd.GeoDataFrame) and src.crs is None:
@@ -90,8 +148,13 @@ class VectorTiler(object):
         tile_gen = self.tile_generator(src, tile_bounds, tile_bounds_crs,
                                        geom_type, split_multi_geoms,
                                        min_partial_perc,
-                                       obj_id_col=obj_id_col)
+                                       obj_id_col=obj_id_col, bulk=bulk)
         self.tile_paths = []
+        to_parquet = self.output_format.lower() == 'parquet'
+        if to_parquet:
+            parquet_path = os.path.join(self.dest_dir,
+                                        dest_fname_base + '.parquet')
+            tile_gdfs = []
         for tile_gdf, tb, i in tqdm(tile_gen):
             tile_id = str(i).zfill(4)  # give zero padding for easier sorting
             if self.proj_unit not in ['meter', 'metre']:
@@ -105,15 +168,23 @@ class VectorTiler(object):
                     dest_fname_base,
                     tile_id,
                     output_ext))
+            if to_parquet:
+                tile_id = os.path.splitext(os.path.basename(dest_path))[0]
+                self.tile_paths.append(os.path.join(parquet_path, tile_id))
+                tile_gdf = tile_gdf.assign(tile_id=tile_id)
+                tile_gdfs.append(tile_gdf)
+                continue
             self.tile_paths.append(dest_path)
             if len(tile_gdf) > 0:
                 tile_gdf.to_file(dest_path, driver='GeoJSON')
             else:
                 save_empty_geojson(dest_path, self.dest_crs)
+        if to_parquet:
+            save_parquet_tiles(tile_gdfs, parquet_path, self.dest_crs)
 
     def tile_generator(self, src, tile_bounds, tile_bounds_crs=None,
                        geom_type='Polygon', split_multi_geoms=True,
-                       min_partial_perc=0.0, obj_id_col=None):
+                       min_partial_perc=0.0, obj_id_col=None, bulk=False):
         """Generate `src` vector data tiles bounded by `tile_bounds`.
 
         Arguments
@@ -148,6 +219,9 @@ class VectorTiler(object):
             a unique identifier for each geometry (e.g. the ``"BuildingId"``
             column in many SpaceNet datasets.) See
             :func:`solaris.utils.geo.split_multi_geometries` for more.
+        bulk : bool, optional (default: False)
+            Clip all tiles at once with :func:`bulk_clip_gdf`. Only used if
+            `geom_type` is ``"Polygon"``.
 
         Yields
         ------
@@ -175,18 +249,30 @@ class VectorTiler(object):
         self.proj_unit = get_projection_unit(self.src_crs)
         if getattr(self, 'dest_crs', None) is None:
             self.dest_crs = self.src_crs
+        labels = LabelStore(self.src, geom_type)
+        if bulk and geom_type == 'Polygon':
+            if reproject_bounds:
+                clip_polys = [reproject_geometry(box(*tb), tile_bounds_crs,
+                                                 self.src_crs)
+                              for tb in tile_bounds]
+            else:
+                clip_polys = [box(*tb) for tb in tile_bounds]
+            tile_gdfs = bulk_clip_gdf(labels, clip_polys, min_partial_perc,
+                                      geom_type)
         for i, tb in enumerate(tile_bounds):
             if self.super_verbose:
                 print("\n", i, "/", len(tile_bounds))
-            if reproject_bounds:
-                tile_gdf = clip_gdf(self.src,
+            if bulk and geom_type == 'Polygon':
+                tile_gdf = next(tile_gdfs)
+            elif reproject_bounds:
+                tile_gdf = clip_gdf(labels,
                                     reproject_geometry(box(*tb),
                                                        tile_bounds_crs,
                                                        self.src_crs),
                                     min_partial_perc,
                                     geom_type, verbose=self.super_verbose)
             else:
-                tile_gdf = clip_gdf(self.src, tb, min_partial_perc, geom_type,
+                tile_gdf = clip_gdf(labels, tb, min_partial_perc, geom_type,
                                     verbose=self.super_verbose)
             if self.src_crs != self.dest_crs:
                 tile_gdf = tile_gdf.to_crs(crs=self.dest_crs.to_wkt())
@@ -195,6 +281,57 @@ class VectorTiler(object):
             yield tile_gdf, tb, i
 
 
+def save_parquet_tiles(tile_gdfs, path, crs, row_group_size=1024):
+    """Write the tiles of :meth:`VectorTiler.tile` to one GeoParquet.
+
+    Rows are kept in tile order, so with `row_group_size` rows per row group
+    the row group statistics of `tile_id` let :func:`read_vector_tile` skip
+    most of the file.
+    """
+    tile_gdfs = [gdf for gdf in tile_gdfs if len(gdf) > 0]
+    if tile_gdfs:
+        gdf = pd.concat(tile_gdfs, ignore_index=True)
+    else:
+        gdf = gpd.GeoDataFrame({'tile_id': np.array([], dtype=str)},
+                               geometry=[],
+                               crs=_check_crs(crs).to_wkt())
+    gdf.to_parquet(path, index=False, row_group_size=row_group_size)
+
+
+def split_tile_path(path):
+    """Split a ``{file}.parquet/{tile_id}`` tile path.
+
+    Returns ``(parquet_path, tile_id)``, or ``(path, None)`` for a path to a
+    file.
+    """
+    parquet_path, tile_id = os.path.split(path)
+    if parquet_path.endswith('.parquet'):
+        return parquet_path, tile_id
+    return path, None
+
+
+def read_vector_tile(path):
+    """Read a vector tile written by :class:`VectorTiler`.
+
+    Arguments
+    ---------
+    path : str
+        Path to a GeoJSON tile, or a ``{file}.parquet/{tile_id}`` reference
+        to a tile in a GeoParquet (see `VectorTiler.tile_paths`).
+
+    Returns
+    -------
+    tile_gdf : :py:class:`geopandas.GeoDataFrame`
+        The tile's objects. Empty tiles give an empty frame.
+    """
+    parquet_path, tile_id = split_tile_path(path)
+    if tile_id is None:
+        return gpd.read_file(path)
+    tile_gdf = gpd.read_parquet(parquet_path,
+                                filters=[('tile_id', '==', tile_id)])
+    return tile_gdf.drop(columns='tile_id').reset_index(drop=True)
+
+
 def search_gdf_polygon(gdf, tile_polygon):
     """Find polygons in a GeoDataFrame that overlap with `tile_polygon` .
 
@@ -246,8 +383,10 @@ def clip_gdf(gdf, tile_bounds, min_partial_perc=0.0, geom_type="Polygon",
 
     Arguments
     ---------
-    gdf : :py:class:`geopandas.GeoDataFrame`
-        A :py:class:`geopandas.GeoDataFrame` of polygons to clip.
+    gdf : :py:class:`geopandas.GeoDataFrame` or :class:`LabelStore`
+        A :py:class:`geopandas.GeoDataFrame` of polygons to clip. With a
+        :class:`LabelStore`, only the objects intersecting `tile_bounds`
+        are subset and clipped (for Polygons), without copying the frame.
     tile_bounds : `list` or :class:`shapely.geometry.Polygon`
         The geometry to clip objects in `gdf` to. This can either be a
         ``[left, top, right, bottom] `` bounds list or a
@@ -278,30 +417,27 @@ def clip_gdf(gdf, tile_bounds, min_partial_perc=0.0, geom_type="Polygon",
         tb = box(*tile_bounds)
     elif isinstance(tile_bounds, Polygon):
         tb = tile_bounds
-    if use_sindex and (geom_type == "Polygon"):
-        gdf = search_gdf_polygon(gdf, tb)
-
-    # if geom_type == "LineString":
-    if 'origarea' in gdf.columns:
-        pass
-    else:
-        if "geom_type" == "LineString":
-            gdf['origarea'] = 0
+    if isinstance(gdf, LabelStore):
+        labels = gdf
+        gdf = labels.gdf
+        if geom_type == "Polygon" and min_partial_perc >= 0:
+            # objects outside the tile would be dropped with partialDec == 0
+            idx = labels.query(tb)
         else:
-            gdf['origarea'] = gdf.area
-
-    if 'origlen' in gdf.columns:
-        pass
+            idx = np.arange(len(labels))
+        cut_gdf = gdf.iloc[idx].copy()
+        cut_gdf.geometry = gpd.GeoSeries(labels.geoms[idx].intersection(tb),
+                                         index=cut_gdf.index, crs=labels.crs)
     else:
-        if "geom_type" == "LineString":
-            gdf['origlen'] = gdf.length
-        else:
-            gdf['origlen'] = 0
-    # TODO must implement different case for lines and for spatialIndex
-    # (Assume RTree is already performed)
+        if use_sindex and (geom_type == "Polygon"):
+            gdf = search_gdf_polygon(gdf, tb)
+
+        _add_orig_measures(gdf, geom_type)
+        # TODO must implement different case for lines and for spatialIndex
+        # (Assume RTree is already performed)
 
-    cut_gdf = gdf.copy()
-    cut_gdf.geometry = gdf.intersection(tb)
+        cut_gdf = gdf.copy()
+        cut_gdf.geometry = gdf.intersection(tb)
 
     if geom_type == 'Polygon':
         cut_gdf['partialDec'] = cut_gdf.area / cut_gdf['origarea']
@@ -322,3 +458,83 @@ def clip_gdf(gdf, tile_bounds, min_partial_perc=0.0, geom_type="Polygon",
     # TODO: IMPLEMENT TRUNCATION MEASUREMENT FOR LINESTRINGS
 
     return cut_gdf
+
+
+def bulk_clip_gdf(gdf, tile_polys, min_partial_perc=0.0, geom_type="Polygon"):
+    """Clip `gdf` to many tiles at once.
+
+    Gives the same output as calling :func:`clip_gdf` for each tile with
+    ``geom_type="Polygon"``, but instead of intersecting every object with
+    every tile, the (tile, object) pairs that intersect are found with one
+    bulk query of the `gdf` spatial index (an STRtree), and only those pairs
+    are clipped, in a single vectorised call.
+
+    Arguments
+    ---------
+    gdf : :py:class:`geopandas.GeoDataFrame` or :class:`LabelStore`
+        A :py:class:`geopandas.GeoDataFrame` of polygons to clip.
+    tile_polys : list
+        A :class:`shapely.geometry.Polygon` per tile.
+    min_partial_perc : float, optional
+        The minimum fraction of an object in `gdf` that must be
+        preserved. Defaults to 0.0.
+    geom_type : str, optional
+        Type of objects in `gdf`. Only ``"Polygon"`` is supported.
+
+    Yields
+    ------
+    cut_gdf : :py:class:`geopandas.GeoDataFrame`
+        `gdf` clipped to each tile of `tile_polys` in turn, as
+        :func:`clip_gdf` returns it.
+    """
+    if geom_type != "Polygon":
+        raise ValueError("bulk_clip_gdf() only supports Polygons.")
+    if isinstance(gdf, LabelStore):
+        labels = gdf
+    else:
+        labels = LabelStore(gdf, geom_type)
+    gdf = labels.gdf
+    tile_arr = gpd.array.from_shapely(tile_polys)
+    sindex = labels.sindex
+    if hasattr(sindex, 'query_bulk'):
+        tile_idx, geom_idx = sindex.query_bulk(tile_arr, predicate='intersects')
+    else:
+        tile_idx, geom_idx = sindex.query(tile_arr, predicate='intersects')
+    # keep the row order of `gdf` within each tile, as clip_gdf() does
+    order = np.lexsort((geom_idx, tile_idx))
+    tile_idx, geom_idx = tile_idx[order], geom_idx[order]
+
+    clipped = labels.geoms[geom_idx].intersection(tile_arr[tile_idx])
+    partial = clipped.area / labels.area[geom_idx]
+    keep = partial > min_partial_perc
+    tile_idx, geom_idx = tile_idx[keep], geom_idx[keep]
+    clipped, partial = clipped[keep], partial[keep]
+
+    starts = np.searchsorted(tile_idx, np.arange(len(tile_polys) + 1))
+    for i in range(len(tile_polys)):
+        sl = slice(starts[i], starts[i + 1])
+        cut_gdf = gdf.iloc[geom_idx[sl]].copy()
+        cut_gdf.geometry = gpd.GeoSeries(clipped[sl], index=cut_gdf.index,
+                                         crs=labels.crs)
+        cut_gdf['partialDec'] = partial[sl]
+        cut_gdf['truncated'] = (cut_gdf['partialDec'] != 1.0).astype(int)
+        yield cut_gdf
+
+
+def _add_orig_measures(gdf, geom_type="Polygon"):
+    """Add `origarea` and `origlen` columns to `gdf` in place if missing."""
+    if 'origarea' in gdf.columns:
+        pass
+    else:
+        if geom_type == "LineString":
+            gdf['origarea'] = 0
+        else:
+            gdf['origarea'] = gdf.area
+
+    if 'origlen' in gdf.columns:
+        pass
+    else:
+        if geom_type == "LineString":
+            gdf['origlen'] = gdf.length
+        else:
+            gdf['origlen'] = 0
@@ -0,0 +1,23 @@
+import os
+
+from timebudget import timebudget
+from dataset_cfg import cfg
+from lib.stats import collect_stats, save_stats, get_stats_path
+from lib.manifest import list_tile_fns
+
+
+if __name__ == '__main__':
+    # statistics of the training tiles, used to normalise every split
+    # for stripes, pass their paths to collect_stats instead
+    raster_dir = os.path.join(cfg["out_dir"], cfg["name"], 'raster')
+    paths = [os.path.join(raster_dir, fn) for fn in list_tile_fns(cfg, 'train')]
+    if len(paths) == 0:
+        raise ValueError(f'no train tiles in {raster_dir} or the tile manifest')
+    print(f'collecting stats of {len(paths)} tiles')
+
+    with timebudget('STATS'):
+        stats = collect_stats(paths, cfg["channel"], processes=4)
+
+    stats_path = get_stats_path(cfg)
+    save_stats(stats, stats_path, cfg["clip_quantiles"])
+    print(f'stats saved to {stats_path}')
@@ -1,20 +1,19 @@
 import os
 import json
-import glob
-from multiprocessing import Pool
 
 from numpy import ceil
 
 from timebudget import timebudget
 from dataset_cfg import cfg
-from lib.tfrec import create_tfrecord_parallel, get_tile_paths
+from lib.tfrec import create_tfrecord_parallel, create_tfrecord_pipelined, get_tile_paths
+from lib.tile_cache import TileCache
+from lib.manifest import list_tile_fns
 
 
 
 
 def get_tot_tf(cfg, split):
-    path = os.path.join(cfg["out_dir"], cfg["name"], 'raster', f'*{split}*.tif')
-    tot_ex = len(glob.glob(path))    # total examples
+    tot_ex = len(list_tile_fns(cfg, split))    # total examples
     if split=='train':
         per_ex = int(ceil(tot_ex*cfg["perc_data"]))
         print(f'loading {per_ex} out of {tot_ex} training data')
@@ -49,15 +48,13 @@ if __name__ == '__main__':
             # basename of tfrec file
             base_fn = os.path.join(base_dir, split)
 
-            args = []
-            for proc_idx in range(tot_tf):
-                args.append((proc_idx, base_fn, split, cfg))
-
             # serial implement
-            # for _args in args: create_tfrecord_parallel(*_args)
+            # for proc_idx in range(tot_tf): create_tfrecord_parallel(proc_idx, base_fn, split, cfg)
             
-            proc_pool = Pool(4)
-            proc_pool.starmap(create_tfrecord_parallel, args)
+            create_tfrecord_pipelined(base_fn, split, cfg, processes=4)
+
+            if cfg["tile_cache_dir"]:
+                TileCache(cfg["tile_cache_dir"], int(cfg["tile_cache_gb"] * 2**30)).evict()
 
     # save config
     cfg_fn = os.path.join(base_dir, 'cfg.json')
@@ -2,15 +2,14 @@ import solaris.raster_tile as raster_tile
 import solaris.vector_tile as vector_tile
 from shapely.geometry import box
 import os
-import geopandas as gpd
+import numpy as np
 import pickle
+import rasterio as rs
+from rasterio import features as feat
+from rasterio import windows
 
-def get_label_gdf(split, in_dir):
-    """split: str. 'train', 'val', 'test'
-    in_dir: str. root path to folder containing .geojson
-    """
-    fn = f'SN6_AOI_11_Rotterdam_Buildings_GT20sqm-{split.capitalize()}.geojson'
-    return gpd.read_file(os.path.join(in_dir, fn))
+from lib.labels import get_label_gdf, get_label_stripe_path
+from lib.manifest import write_manifest
 
 def get_labels_bounds(label_dir):
     """returns [labels, bounds]
@@ -82,21 +81,72 @@ def raster_vector_tiling(cfg, labels, bounds, timestamp, orient, in_path, out_pa
                                        src_tile_size=(640, 640),
                                        aoi_boundary=bounds[split],
                                        verbose=cfg["verbose"],
-                                       stride=(cfg["stride"],cfg["stride"]))
+                                       stride=(cfg["stride"],cfg["stride"]),
+                                       snap_to_grid=cfg["label_engine"] == 'stripe')
         
         raster_tiler.tile(in_path, dest_fname_base=fn, nodata_threshold=0.5)
         print('saving scheme')
         save_tile_scheme(cfg, timestamp, orient, split, raster_tiler)
+        if cfg["tile_manifest"]:
+            write_manifest(cfg, raster_tiler.tile_scheme, raster_tiler.tile_nodata, labels[split])
+
+        raster_dict[split] = raster_tiler
+        if cfg["label_engine"] in ['direct', 'stripe']:
+            # labels are rasterised straight from labels[split] instead
+            continue
 
         # use created tiles for vector tiling
         vector_tiler = vector_tile.VectorTiler(dest_dir=vector_save_path,
-                                               super_verbose=cfg["verbose"])
+                                               super_verbose=cfg["verbose"],
+                                               output_format=cfg["vector_format"])
         
         vector_tiler.tile(labels[split], tile_bounds=raster_tiler.tile_bounds,
-                          split_multi_geoms=False, dest_fname_base=fn)
+                          split_multi_geoms=False, dest_fname_base=fn,
+                          bulk=True)
         
-        raster_dict[split] = raster_tiler
         vector_dict[split] = vector_tiler
         
     # return for debugging
-    return raster_dict, vector_dict
\ No newline at end of file
+    return raster_dict, vector_dict
+
+def save_label_stripe(cfg, timestamp, orient, split, labels, in_path, block_rows=2048):
+    """rasterises the labels of a split once on the grid of the stripe (in_path)
+    and ANDs them with its valid-data mask. tiles of this stripe then get their
+    label by slicing the same window they are read with (see lib.tfrec)
+    saved as a .npy bit-packed along rows (np.unpackbits(axis=1)), to be
+    memory-mapped, and a .pickle with the stripe 'transform' and 'shape'
+    labels : geodataframe of building footprints, same crs as the stripe
+    block_rows : int
+        rows rasterised at a time
+    """
+    mask_path, grid_path = get_label_stripe_path(cfg, timestamp, orient, split)
+    if not os.path.isdir(os.path.dirname(mask_path)):
+        os.makedirs(os.path.dirname(mask_path))
+
+    src = rs.open(in_path)
+    h, w = src.height, src.width
+    packed = np.lib.format.open_memmap(
+        mask_path, mode='w+', dtype=np.uint8, shape=(h, (w + 7) // 8))
+    sindex = labels.sindex
+    for row0 in range(0, h, block_rows):
+        rows = min(block_rows, h - row0)
+        window = windows.Window(0, row0, w, rows)
+        transform = src.window_transform(window)
+        idx = sindex.query(box(*windows.bounds(window, src.transform)), predicate='intersects')
+        if len(idx) == 0:
+            packed[row0:row0+rows] = 0
+            continue
+        mask = feat.geometry_mask(
+            labels.geometry.iloc[np.sort(idx)],
+            out_shape=(rows, w),
+            transform=transform,
+            invert=True  # pixel buildings == 1
+        )
+        mask &= src.read_masks(1, window=window) > 0
+        packed[row0:row0+rows] = np.packbits(mask, axis=1)
+    packed.flush()
+    del packed
+
+    with open(grid_path, 'wb') as f:
+        pickle.dump({'transform': src.transform, 'shape': (h, w)}, f)
+    src.close()
@@ -7,25 +7,51 @@ each time_stamp has a pickle object containing:
 this {timestamp}_s{stride}.pickle can be used to quickly create tiling
 """
 import os
-import pickle
 import time
+from multiprocessing import Pool
+
+import numpy as np
+from numpy import ceil
 from rasterio import windows
 import rasterio as rs
 
+from solaris.geo import snap_bounds
+from lib.labels import load_scheme
+
 
-def load_scheme(cfg, timestamp, orient, split):
-    """scheme contains [name, bound, profile] for each filtered tiles (above nodata_threshold)
+def get_nodata_perc(tile_data, nodata):
+    """fraction of the pixels of a [c,h,w] tile that are nodata"""
+    if nodata is None:
+        return 0.
+    if np.isnan(nodata):
+        nodata_count = np.count_nonzero(np.isnan(tile_data[0]))
+    else:
+        nodata_count = np.logical_or.reduce(tile_data == nodata, axis=0).sum()
+    return nodata_count / (tile_data.shape[1] * tile_data.shape[2])
+
+def snap_scheme(scheme, transform):
+    """scheme with its bound and profile transform snapped to the pixel grid
+    of the stripe (transform). schemes saved before the tiler snapped its
+    tiles keep the sub-pixel offset of the aoi in their transform, although
+    the tile is read from the rounded window
+    scheme: [name, bound, profile]
+    only needed by the 'stripe' label_engine, other engines keep the
+    transforms of the scheme
     """
-    out_path = os.path.join(cfg['out_dir'], f"s{cfg['stride']}", 'tile_scheme')
-    fn = '{}_{}_{}.pickle'.format(timestamp, orient, split)
-    fn_path = os.path.join(out_path, fn)
-    with open(fn_path, 'rb') as f:
-        scheme = pickle.load(f)
-    return scheme
+    dest_fname,tb,profile = scheme
+    tb = snap_bounds(tb, transform)
+    profile = dict(profile, transform=rs.transform.from_bounds(
+        *tb, profile['width'], profile['height']))
+    return [dest_fname, tb, profile]
 
-def parallel_tile_generator(scheme, slc_in, raster_dir):
-    # used up to 350MB ram each proc
-    src = rs.open(slc_in)
+def write_tile(src, scheme, raster_dir, snap=False):
+    """crops one tile from an opened src raster and saves it
+    scheme: [name, bound, profile]
+    snap: bool, snaps the scheme to the grid of src first (snap_scheme)
+    returns: nodata fraction of the tile, for the tile manifest
+    """
+    if snap:
+        scheme = snap_scheme(scheme, src.transform)
     dest_fname,tb,profile = scheme
     # get window using tile resolution
     window = windows.from_bounds(
@@ -42,17 +68,54 @@ def parallel_tile_generator(scheme, slc_in, raster_dir):
         for band in range(1, profile['count'] + 1):
             dest.write(tile_data[band-1, :, :], band)
         dest.close()
+    return get_nodata_perc(tile_data, profile['nodata'])
 
+def parallel_tile_generator(scheme, slc_in, raster_dir):
+    # used up to 350MB ram each proc
+    src = rs.open(slc_in)
+    write_tile(src, scheme, raster_dir)
     src.close()
 
-def simple_tile_generator(in_raster_path, out_path, scheme, src_tile_size):
+# persistent source handle of each parallel_tiling worker
+_worker_src = None
+
+def _init_tile_worker(slc_in):
+    global _worker_src
+    _worker_src = rs.open(slc_in)
+
+def _tile_batch(schemes, raster_dir, snap):
+    return [write_tile(_worker_src, scheme, raster_dir, snap) for scheme in schemes]
+
+def parallel_tiling(schemes, slc_in, raster_dir, processes=8, batch_size=None, snap=False):
+    """tiles with a pool where each worker opens slc_in once and keeps the
+    handle (and GDAL's block cache) for all its tiles. schemes are sent in
+    batches of consecutive, spatially adjacent tiles instead of one task per tile
+    schemes: [[name, bound, profile],...]
+    batch_size: int, tiles per task. default splits into 4 batches per process
+    snap: bool, see write_tile
+    returns: nodata fraction of each tile, in the order of schemes
+    """
+    if len(schemes) == 0:
+        return []
+    if batch_size is None:
+        batch_size = int(ceil(len(schemes) / (processes*4)))
+    batches = [(schemes[i:i+batch_size], raster_dir, snap)
+               for i in range(0, len(schemes), batch_size)]
+    with Pool(processes, initializer=_init_tile_worker, initargs=(slc_in,)) as pool:
+        nodata_percs = pool.starmap(_tile_batch, batches)
+    return [perc for batch in nodata_percs for perc in batch]
+
+def simple_tile_generator(in_raster_path, out_path, scheme, src_tile_size, snap=False):
     """snippet from raster_tile.tile_generator
     made for specific settings
     
     scheme:
         [[name, bound, profile],...]
+    snap: bool, see write_tile
     """
     src = rs.open(in_raster_path)
+    if snap:
+        scheme = [snap_scheme(s, src.transform) for s in scheme]
     for dest_fname,tb,profile in scheme:
         # get window using tile resolution
         window = windows.from_bounds(
@@ -86,7 +149,8 @@ def load_raster_vector_tiling(cfg, timestamp, orient, in_path, out_path):
     for split in ['train','val','test']:
         start = time.time()
         scheme = load_scheme(cfg, timestamp, orient, split)
-        simple_tile_generator(in_path, out_path, scheme, (640,640))
+        simple_tile_generator(in_path, out_path, scheme, (640,640),
+                              snap=cfg["label_engine"] == 'stripe')
         
         end = time.time()
         print(f'finished {split} split in {(end-start):.1f}s')